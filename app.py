@@ -1,15 +1,23 @@
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.utils import secure_filename
+import orjson
 import os
 from datetime import datetime
 import uuid
 import tempfile
+import shutil
+import threading
+import time
+import concurrent.futures
+import numpy as np
 from faster_whisper import WhisperModel
 
 # Import our custom modules
 from config import Config
 from claude_service import ClaudeService
-from conversation import ConversationManager
-from helpers import log_conversation
+from conversation import ConversationManager, RedisConversationManager
+from helpers import log_conversation, whisper_device_settings
 from video_analyzer import VideoAnalyzer
 from hr_helper import HRHelper
 from bill_processor import BillProcessor
@@ -21,41 +29,208 @@ import edge_tts
 import asyncio
 import base64
 import io
-from langdetect import detect, LangDetectException
+from langdetect import detect, DetectorFactory, LangDetectException
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, which is much faster on large unicode payloads."""
+    
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.config.from_object(Config)
 app.secret_key = app.config['SECRET_KEY']
 
-# Initialize services
-claude_service = ClaudeService(api_key=app.config['CLAUDE_API_KEY'])
-conversation_manager = ConversationManager()
-
-# Initialize all AI services
-try:
-    video_analyzer = VideoAnalyzer(api_key=app.config['CLAUDE_API_KEY'])
-    hr_helper = HRHelper(api_key=app.config['CLAUDE_API_KEY'])
-    bill_processor = BillProcessor(api_key=app.config['CLAUDE_API_KEY'])
-    contract_processor = ContractProcessor(api_key=app.config['CLAUDE_API_KEY'])
-    financial_processor = FinancialProcessor(api_key=app.config['CLAUDE_API_KEY'])
-    print("All AI services initialized successfully")
-except Exception as e:
-    print(f"Error initializing AI services: {e}")
-    video_analyzer = None
-    hr_helper = None
-    bill_processor = None
-    contract_processor = None
-    financial_processor = None
-
-# Initialize the Faster Whisper model
-model_size = "base"
-try:
-    model = WhisperModel(model_size, device="cpu", compute_type="int8")
-    app.logger.info(f"WhisperModel initialized with size: {model_size}")
-except Exception as e:
-    app.logger.error(f"Failed to initialize WhisperModel: {str(e)}")
-    model = None
+def init_services():
+    """Load the Whisper model and start the AI services, Redis connection and TTS loop."""
+    global claude_service, conversation_manager, model, model_lock, JOB_STORE
+    global video_analyzer, hr_helper, bill_processor, contract_processor, financial_processor
+    
+    # Initialize services
+    claude_service = ClaudeService(api_key=app.config['CLAUDE_API_KEY'])
+    conversation_manager = RedisConversationManager() if Config.REDIS_URL else ConversationManager()
+    
+    # Initialize the Faster Whisper model
+    model_size = Config.WHISPER_MODEL_SIZE
+    try:
+        whisper_device, whisper_compute_type = whisper_device_settings()
+        model = WhisperModel(
+            model_size,
+            device=whisper_device,
+            compute_type=whisper_compute_type,
+            cpu_threads=max(1, (os.cpu_count() or 1) // Config.WORKER_PROCESSES),
+            num_workers=2
+        )
+        # Warm up with one second of silence so kernel selection and mel filter
+        # setup happen at startup instead of on the first user request
+        list(model.transcribe(np.zeros(16000, dtype=np.float32), beam_size=1)[0])
+        app.logger.info(f"WhisperModel initialized with size: {model_size}")
+    except Exception as e:
+        app.logger.error(f"Failed to initialize WhisperModel: {str(e)}")
+        model = None
+    
+    # CTranslate2 is already multithreaded, so concurrent transcribe calls only
+    # fight over the same cores. Serialize them instead.
+    model_lock = threading.Lock()
+    
+    # Initialize all AI services
+    try:
+        # Shares the startup model above instead of loading a second copy, and
+        # its lock, so video and /api/transcribe calls don't run at the same time
+        video_analyzer = VideoAnalyzer(api_key=app.config['CLAUDE_API_KEY'], whisper_model=model,
+                                       transcribe_lock=model_lock)
+        hr_helper = HRHelper(api_key=app.config['CLAUDE_API_KEY'])
+        bill_processor = BillProcessor(api_key=app.config['CLAUDE_API_KEY'])
+        contract_processor = ContractProcessor(api_key=app.config['CLAUDE_API_KEY'])
+        financial_processor = FinancialProcessor(api_key=app.config['CLAUDE_API_KEY'])
+        print("All AI services initialized successfully")
+    except Exception as e:
+        print(f"Error initializing AI services: {e}")
+        video_analyzer = None
+        hr_helper = None
+        bill_processor = None
+        contract_processor = None
+        financial_processor = None
+    
+    # With several workers a result poll can land on a process other than the one
+    # running the job, so job state is also published to Redis when it is configured
+    JOB_STORE = conversation_manager.redis if Config.REDIS_URL else None
+    
+    threading.Thread(target=TTS_LOOP.run_forever, name='tts-loop', daemon=True).start()
+
+# Background jobs for the document analysis routes, so a worker is not
+# blocked while waiting on Claude
+EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=16)
+JOBS = {}
+JOBS_LOCK = threading.Lock()
+JOB_RETENTION_SECONDS = 3600
+
+# Pending job entries in Redis outlive the longest job
+JOB_PENDING_TTL = 2 * 24 * 3600
+
+# Uploads smaller than this are processed straight from memory
+MAX_IN_MEMORY_UPLOAD = 8 << 20
+
+def run_and_clean_up(func, temp_dir, *args):
+    """Run a processor call, then delete the upload's temp directory (if any)."""
+    try:
+        return func(*args)
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+def submit_job(kind, func, temp_dir, *args):
+    """Queue a processor call and return a 202 response with its job id."""
+    job_id = str(uuid.uuid4())
+    future = EXECUTOR.submit(run_and_clean_up, func, temp_dir, *args)
+    
+    if JOB_STORE is not None:
+        JOB_STORE.set(f"job:{job_id}", orjson.dumps({'kind': kind, 'status': 'pending'}), ex=JOB_PENDING_TTL)
+        future.add_done_callback(lambda done: publish_job_result(job_id, kind, done))
+    
+    now = time.time()
+    with JOBS_LOCK:
+        # Forget finished jobs nobody came back for
+        for stale_id in [jid for jid, job in JOBS.items()
+                         if job['future'].done() and now - job['created'] > JOB_RETENTION_SECONDS]:
+            del JOBS[stale_id]
+        JOBS[job_id] = {'kind': kind, 'future': future, 'created': now}
+    
+    return jsonify({'job_id': job_id, 'status': 'pending'}), 202
+
+def stage_upload(file):
+    """
+    Keep small uploads in memory and spill larger ones to a temp directory.
+    
+    Returns:
+        tuple: (BytesIO, filename, None) for in-memory uploads, or
+               (file path, filename, temp_dir) for uploads saved to disk
+    """
+    filename = secure_filename(file.filename)
+    
+    file.stream.seek(0, os.SEEK_END)
+    size = file.stream.tell()
+    file.stream.seek(0)
+    
+    if size < MAX_IN_MEMORY_UPLOAD:
+        return io.BytesIO(file.read()), filename, None
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
+    temp_dir = tempfile.mkdtemp()
+    filepath = os.path.join(temp_dir, timestamp + filename)
+    file.save(filepath)
+    return filepath, filename, temp_dir
+
+def job_outcome(future):
+    """The result dict of a finished job, turning an exception into an error result."""
+    try:
+        return future.result(timeout=0)
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+def publish_job_result(job_id, kind, future):
+    """Store a finished job's result in Redis for result polls served by other workers."""
+    try:
+        entry = orjson.dumps({'kind': kind, 'status': 'done', 'result': job_outcome(future)})
+    except TypeError as e:
+        entry = orjson.dumps({'kind': kind, 'status': 'done', 'result': {'success': False, 'error': str(e)}})
+    try:
+        JOB_STORE.set(f"job:{job_id}", entry, ex=JOB_RETENTION_SECONDS)
+    except Exception as e:
+        app.logger.error(f"Failed to publish result of job {job_id}: {str(e)}")
+
+def job_result(kind, job_id):
+    """Return a job's result, or its pending status if it is still running."""
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+        if job is not None and job['kind'] == kind and job['future'].done():
+            del JOBS[job_id]
+    
+    if job is None and JOB_STORE is not None:
+        # Submitted through another worker process
+        return shared_job_result(kind, job_id)
+    if job is None or job['kind'] != kind:
+        return jsonify({'error': 'Job not found'}), 404
+    if not job['future'].done():
+        return jsonify({'job_id': job_id, 'status': 'pending'}), 202
+    
+    # Any copy published to Redis expires on its own
+    return job_response(job_outcome(job['future']))
+
+def shared_job_result(kind, job_id):
+    """job_result for a job submitted through another worker, read from Redis."""
+    entry = JOB_STORE.get(f"job:{job_id}")
+    job = orjson.loads(entry) if entry is not None else None
+    if job is None or job['kind'] != kind:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] != 'done':
+        return jsonify({'job_id': job_id, 'status': 'pending'}), 202
+    
+    JOB_STORE.delete(f"job:{job_id}")
+    return job_response(job['result'])
+
+def job_response(result):
+    """JSON response for a finished job's result dict."""
+    if result.get('success'):
+        return jsonify({
+            'success': True,
+            'data': result['data']
+        })
+    else:
+        return jsonify({
+            'success': False,
+            'error': result.get('error')
+        }), 500
 
 @app.route('/')
 def home():
@@ -114,6 +289,28 @@ def analyze_cvs():
     
     result = hr_helper.analyze_cvs(job_role, files, top_count)
     
+    if 'error' in result:
+        return jsonify(result), 500
+    
+    # Large runs were queued on the Batches API; the client polls the result route
+    if 'batch_id' in result:
+        return jsonify({'job_id': result['batch_id'], 'status': 'pending'}), 202
+    
+    return jsonify(result)
+
+@app.route('/app/flooky-hr-helper/result/<job_id>')
+def hr_result(job_id):
+    if hr_helper is None:
+        return jsonify({'error': 'HR Helper not available'}), 500
+    
+    try:
+        result = hr_helper.poll_cvs_batch(job_id)
+    except KeyError:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if result is None:
+        return jsonify({'job_id': job_id, 'status': 'pending'}), 202
+    
     if 'error' in result:
         return jsonify(result), 500
     
@@ -136,36 +333,16 @@ def upload_bill():
     if file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
     
-    # Save file temporarily
-    from werkzeug.utils import secure_filename
-    filename = secure_filename(file.filename)
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-    filename = timestamp + filename
-    
-    temp_dir = tempfile.mkdtemp()
-    filepath = os.path.join(temp_dir, filename)
-    file.save(filepath)
-    
-    # Process the bill
-    result = bill_processor.process_bill(filepath)
-    
-    # Clean up
-    try:
-        os.remove(filepath)
-        os.rmdir(temp_dir)
-    except:
-        pass
+    source, filename, temp_dir = stage_upload(file)
     
-    if result['success']:
-        return jsonify({
-            'success': True,
-            'data': result['data']
-        })
-    else:
-        return jsonify({
-            'success': False,
-            'error': result['error']
-        }), 500
+    # Process in the background; the client polls the result route
+    if temp_dir is None:
+        return submit_job('bill', bill_processor.process_bill_stream, None, source, filename)
+    return submit_job('bill', bill_processor.process_bill, temp_dir, source)
+
+@app.route('/app/flooky-bill-analyzer/result/<job_id>')
+def bill_result(job_id):
+    return job_result('bill', job_id)
 
 # Legal Document Checker App
 @app.route('/app/flooky-legal-checker')
@@ -184,36 +361,16 @@ def upload_contract():
     if file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
     
-    # Save file temporarily
-    from werkzeug.utils import secure_filename
-    filename = secure_filename(file.filename)
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-    filename = timestamp + filename
-    
-    temp_dir = tempfile.mkdtemp()
-    filepath = os.path.join(temp_dir, filename)
-    file.save(filepath)
-    
-    # Process the contract
-    result = contract_processor.process_contract(filepath)
-    
-    # Clean up
-    try:
-        os.remove(filepath)
-        os.rmdir(temp_dir)
-    except:
-        pass
+    source, filename, temp_dir = stage_upload(file)
     
-    if result['success']:
-        return jsonify({
-            'success': True,
-            'data': result['data']
-        })
-    else:
-        return jsonify({
-            'success': False,
-            'error': result['error']
-        }), 500
+    # Process in the background; the client polls the result route
+    if temp_dir is None:
+        return submit_job('contract', contract_processor.process_contract_stream, None, source, filename)
+    return submit_job('contract', contract_processor.process_contract, temp_dir, source)
+
+@app.route('/app/flooky-legal-checker/result/<job_id>')
+def contract_result(job_id):
+    return job_result('contract', job_id)
 
 # Financial Advisor App
 @app.route('/app/flooky-financial-advisor')
@@ -240,36 +397,18 @@ def analyze_finances():
     if not financial_goal:
         return jsonify({'error': 'Financial goal is required'}), 400
     
-    # Save file temporarily
-    from werkzeug.utils import secure_filename
-    filename = secure_filename(file.filename)
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-    filename = timestamp + filename
-    
-    temp_dir = tempfile.mkdtemp()
-    filepath = os.path.join(temp_dir, filename)
-    file.save(filepath)
-    
-    # Process the financial data
-    result = financial_processor.process_financial_data(filepath, financial_goal, goal_amount, goal_timeframe)
-    
-    # Clean up
-    try:
-        os.remove(filepath)
-        os.rmdir(temp_dir)
-    except:
-        pass
+    source, filename, temp_dir = stage_upload(file)
     
-    if result['success']:
-        return jsonify({
-            'success': True,
-            'data': result['data']
-        })
-    else:
-        return jsonify({
-            'success': False,
-            'error': result['error']
-        }), 500
+    # Process in the background; the client polls the result route
+    if temp_dir is None:
+        return submit_job('financial', financial_processor.process_financial_data_stream, None,
+                          source, filename, financial_goal, goal_amount, goal_timeframe)
+    return submit_job('financial', financial_processor.process_financial_data, temp_dir,
+                      source, financial_goal, goal_amount, goal_timeframe)
+
+@app.route('/app/flooky-financial-advisor/result/<job_id>')
+def financial_result(job_id):
+    return job_result('financial', job_id)
 
 # Contact form handler
 @app.route('/api/contact', methods=['POST'])
@@ -293,14 +432,14 @@ def chat():
     user_message = data['message']
     user_id = session.get('user_id', str(uuid.uuid4()))
     
-    conversation = conversation_manager.get_conversation(user_id)
-    if not conversation:
-        conversation = conversation_manager.create_conversation(
+    if not conversation_manager.get_conversation(user_id):
+        conversation_manager.create_conversation(
             user_id,
             system_message="You are a friendly chatbot that responds with short sentences and uses emojis frequently. Keep your responses brief and cheerful!"
         )
     
     conversation_manager.add_message(user_id, "user", user_message)
+    conversation = conversation_manager.get_conversation_for_claude(user_id)
     
     try:
         assistant_message = claude_service.get_response(conversation)
@@ -319,6 +458,37 @@ def chat():
             'error': str(e)
         }), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.json
+    user_message = data['message']
+    user_id = session.get('user_id', str(uuid.uuid4()))
+    
+    if not conversation_manager.get_conversation(user_id):
+        conversation_manager.create_conversation(
+            user_id,
+            system_message="You are a friendly chatbot that responds with short sentences and uses emojis frequently. Keep your responses brief and cheerful!"
+        )
+    
+    conversation_manager.add_message(user_id, "user", user_message)
+    conversation = conversation_manager.get_conversation_for_claude(user_id)
+    
+    def generate():
+        # Forward text to the browser as Claude produces it, then record the full reply
+        parts = []
+        for chunk in claude_service.stream_response(conversation):
+            parts.append(chunk)
+            yield chunk
+        assistant_message = "".join(parts)
+        conversation_manager.add_message(user_id, "assistant", assistant_message)
+        log_conversation(user_id, user_message, assistant_message)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/plain',
+        headers={'X-Conversation-Id': user_id, 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/reset', methods=['POST'])
 def reset_conversation():
     user_id = session.get('user_id', str(uuid.uuid4()))
@@ -342,26 +512,29 @@ def transcribe():
     if audio_file.filename == '':
         return jsonify({'error': 'Empty audio file'}), 400
 
-    temp_audio_path = None
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_audio:
-            audio_file.save(temp_audio.name)
-            temp_audio_path = temp_audio.name
-        
-        file_size = os.path.getsize(temp_audio_path)
-        app.logger.info(f"Audio file saved: {temp_audio_path}, size: {file_size} bytes")
+        # faster-whisper decodes file-like objects directly, so the upload
+        # never needs to touch the disk
+        audio_stream = io.BytesIO(audio_file.read())
+        file_size = audio_stream.getbuffer().nbytes
+        app.logger.info(f"Audio file received, size: {file_size} bytes")
         
         if file_size == 0:
-            os.unlink(temp_audio_path)
             return jsonify({'error': 'Empty audio file (zero bytes)'}), 400
 
-        segments, info = model.transcribe(temp_audio_path, beam_size=5)
-
-        transcript = ""
-        for segment in segments:
-            transcript += segment.text + " "
-
-        os.unlink(temp_audio_path)
+        # Greedy decoding with VAD gating is as accurate as beam search on short
+        # chat utterances and suppresses hallucinations on silence
+        # Segments are generated lazily, so consume them while holding the lock
+        with model_lock:
+            segments, info = model.transcribe(
+                audio_stream,
+                beam_size=1,
+                vad_filter=True,
+                vad_parameters=dict(min_silence_duration_ms=500),
+                condition_on_previous_text=False,
+                without_timestamps=True
+            )
+            transcript = " ".join(segment.text for segment in segments)
         
         if not transcript.strip():
             return jsonify({'transcript': '', 'message': 'No speech detected'}), 200
@@ -370,36 +543,46 @@ def transcribe():
 
     except Exception as e:
         app.logger.error(f"Error transcribing audio: {str(e)}")
-        if temp_audio_path and os.path.exists(temp_audio_path):
-            os.unlink(temp_audio_path)
         return jsonify({'error': f'Transcription error: {str(e)}'}), 500
 
-LANGUAGE_TO_VOICE = {
-    'en': 'en-US-AriaNeural',
-    'es': 'es-ES-ElviraNeural',
-    'fr': 'fr-FR-DeniseNeural',
-    'zh': 'zh-CN-XiaoxiaoNeural',
-    'ar': 'ar-SA-ZariyahNeural',
-    'pt': 'pt-BR-FranciscaNeural',
-    'de': 'de-DE-KatjaNeural',
-    'it': 'it-IT-ElsaNeural',
-    'ja': 'ja-JP-NanamiNeural',
-    'ko': 'ko-KR-SunHiNeural',
-    'ru': 'ru-RU-SvetlanaNeural',
-    'hi': 'hi-IN-SwaraNeural',
-    'tr': 'tr-TR-EmelNeural',
-    'nl': 'nl-NL-ColetteNeural',
-    'pl': 'pl-PL-AgnieszkaNeural',
-    'sv': 'sv-SE-SofieNeural',
-    'el': 'el-GR-AthinaNeural',
-    'he': 'he-IL-HilaNeural',
-    'id': 'id-ID-GadisNeural',
-    'vi': 'vi-VN-HoaiMyNeural',
-    'th': 'th-TH-AcharaNeural',
+# Language code -> (language name, Edge TTS voice)
+LANG_INFO = {
+    'en': ('English', 'en-US-AriaNeural'),
+    'es': ('Spanish', 'es-ES-ElviraNeural'),
+    'fr': ('French', 'fr-FR-DeniseNeural'),
+    'zh': ('Chinese', 'zh-CN-XiaoxiaoNeural'),
+    'ar': ('Arabic', 'ar-SA-ZariyahNeural'),
+    'pt': ('Portuguese', 'pt-BR-FranciscaNeural'),
+    'de': ('German', 'de-DE-KatjaNeural'),
+    'it': ('Italian', 'it-IT-ElsaNeural'),
+    'ja': ('Japanese', 'ja-JP-NanamiNeural'),
+    'ko': ('Korean', 'ko-KR-SunHiNeural'),
+    'ru': ('Russian', 'ru-RU-SvetlanaNeural'),
+    'hi': ('Hindi', 'hi-IN-SwaraNeural'),
+    'tr': ('Turkish', 'tr-TR-EmelNeural'),
+    'nl': ('Dutch', 'nl-NL-ColetteNeural'),
+    'pl': ('Polish', 'pl-PL-AgnieszkaNeural'),
+    'sv': ('Swedish', 'sv-SE-SofieNeural'),
+    'el': ('Greek', 'el-GR-AthinaNeural'),
+    'he': ('Hebrew', 'he-IL-HilaNeural'),
+    'id': ('Indonesian', 'id-ID-GadisNeural'),
+    'vi': ('Vietnamese', 'vi-VN-HoaiMyNeural'),
+    'th': ('Thai', 'th-TH-AcharaNeural'),
 }
 
 DEFAULT_VOICE = 'en-US-AriaNeural'
 
+# One long-lived event loop for Edge TTS instead of a fresh loop per request,
+# run on a thread started by init_services()
+TTS_LOOP = asyncio.new_event_loop()
+TTS_TIMEOUT_SECONDS = 30
+
+# Make langdetect deterministic so the same text always picks the same voice
+DetectorFactory.seed = 0
+
+# The first few hundred characters are plenty to pick a voice
+LANGUAGE_SAMPLE_CHARS = 200
+
 @app.route('/detect-language', methods=['POST'])
 def detect_language():
     try:
@@ -409,19 +592,14 @@ def detect_language():
         if not text.strip():
             return jsonify({'language': 'unknown', 'voice': DEFAULT_VOICE})
         
-        lang_code = detect(text)
-        voice = LANGUAGE_TO_VOICE.get(lang_code, DEFAULT_VOICE)
-        
-        language_names = {
-            'en': 'English', 'es': 'Spanish', 'fr': 'French', 'zh': 'Chinese',
-            'ar': 'Arabic', 'pt': 'Portuguese', 'de': 'German', 'it': 'Italian',
-            'ja': 'Japanese', 'ko': 'Korean', 'ru': 'Russian', 'hi': 'Hindi',
-            'tr': 'Turkish', 'nl': 'Dutch', 'pl': 'Polish', 'sv': 'Swedish',
-            'el': 'Greek', 'he': 'Hebrew', 'id': 'Indonesian', 'vi': 'Vietnamese',
-            'th': 'Thai',
-        }
+        sample = text[:LANGUAGE_SAMPLE_CHARS]
+        if not any(char.isalpha() for char in sample):
+            # Digits and punctuation only: nothing for langdetect to score
+            return jsonify({'language': 'unknown', 'voice': DEFAULT_VOICE})
         
-        language_name = language_names.get(lang_code, 'Unknown')
+        lang_code = detect(sample)
+        # langdetect reports Chinese as zh-cn / zh-tw, so look up the base code
+        language_name, voice = LANG_INFO.get(lang_code.split('-')[0], ('Unknown', DEFAULT_VOICE))
         
         return jsonify({
             'language_code': lang_code,
@@ -440,23 +618,65 @@ def text_to_speech():
         text = data.get('text', '')
         voice = data.get('voice', DEFAULT_VOICE)
         
-        audio_data = asyncio.run(generate_speech(text, voice))
+        future = asyncio.run_coroutine_threadsafe(generate_speech(text, voice), TTS_LOOP)
+        audio_data = future.result(timeout=TTS_TIMEOUT_SECONDS)
         
         encoded_audio = base64.b64encode(audio_data).decode('utf-8')
         return jsonify({'audio': encoded_audio})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-async def generate_speech(text, voice):
+@app.route('/text-to-speech-stream', methods=['GET', 'POST'])
+def text_to_speech_stream():
+    """Stream MP3 audio as Edge TTS produces it (usable directly as an <audio> src)."""
+    data = request.get_json(silent=True) or request.args
+    text = data.get('text', '')
+    voice = data.get('voice', DEFAULT_VOICE)
+    
+    if not text.strip():
+        return jsonify({'error': 'No text provided'}), 400
+    
+    def generate():
+        chunks = stream_speech(text, voice)
+        try:
+            while True:
+                future = asyncio.run_coroutine_threadsafe(next_chunk(chunks), TTS_LOOP)
+                chunk = future.result(timeout=TTS_TIMEOUT_SECONDS)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            asyncio.run_coroutine_threadsafe(chunks.aclose(), TTS_LOOP).result(timeout=TTS_TIMEOUT_SECONDS)
+    
+    return Response(stream_with_context(generate()), mimetype='audio/mpeg')
+
+async def next_chunk(chunks):
+    """Return the next item of an async iterator, or None when it is exhausted."""
+    try:
+        return await chunks.__anext__()
+    except StopAsyncIteration:
+        return None
+
+async def stream_speech(text, voice):
     communicate = edge_tts.Communicate(text, voice)
-    audio_data = io.BytesIO()
     
     async for chunk in communicate.stream():
         if chunk["type"] == "audio":
-            audio_data.write(chunk["data"])
+            yield chunk["data"]
+
+async def generate_speech(text, voice):
+    audio_data = io.BytesIO()
     
-    audio_data.seek(0)
-    return audio_data.read()
+    async for data in stream_speech(text, voice):
+        audio_data.write(data)
+    
+    return audio_data.getvalue()
+
+# The shared process pool's spawned workers re-run this script as __mp_main__
+# before unpickling their tasks; they only need the processor modules, not the
+# Whisper model, the services or the TTS loop
+if __name__ != '__mp_main__':
+    init_services()
 
 if __name__ == '__main__':
     app.run(debug=app.config['DEBUG'], host='0.0.0.0', port=5000)
\ No newline at end of file
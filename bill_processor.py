@@ -1,17 +1,61 @@
 import os
-import json
+import copy
+import math
+import orjson
 import logging
-from typing import Dict, List, Any
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, BinaryIO, Union
 import fitz  # PyMuPDF
 import pytesseract
 from PIL import Image
-import requests
-import re
+from cachetools import TTLCache
 from datetime import datetime
 from config import Config
+from helpers import anthropic_session, extract_json, retry_with_backoff, truncate_to_token_budget
 
 logger = logging.getLogger(__name__)
 
+# Plain text extraction without the extra layout analysis we would discard
+_PDF_TEXT_FLAGS = fitz.TEXT_PRESERVE_LIGATURES | fitz.TEXT_PRESERVE_WHITESPACE
+
+# Longest image edge handed to Tesseract; phone photos are downscaled to this
+_OCR_MAX_EDGE = 1600
+
+# Shared with the other analyzers so Anthropic calls reuse pooled connections
+_SESSION = anthropic_session()
+
+# Analyses keyed by a hash of the extracted text, so re-uploads skip Claude
+_ANALYSIS_CACHE = TTLCache(maxsize=1024, ttl=86400)
+_ANALYSIS_CACHE_LOCK = threading.Lock()
+
+def _cached_analysis(cache_key):
+    """Return a private copy of a cached analysis, or None."""
+    with _ANALYSIS_CACHE_LOCK:
+        analysis = _ANALYSIS_CACHE.get(cache_key)
+    return copy.deepcopy(analysis) if analysis is not None else None
+
+def _cache_analysis(cache_key, analysis):
+    """Cache a copy of an analysis so callers can't alter what later hits see."""
+    analysis = copy.deepcopy(analysis)
+    with _ANALYSIS_CACHE_LOCK:
+        _ANALYSIS_CACHE[cache_key] = analysis
+
+def _as_float(value, default=0.0):
+    """Coerce a JSON value to float without raising; numbers take the fast path."""
+    value_type = type(value)
+    if value_type is float:
+        return value
+    if value_type is int:
+        return float(value)
+    if value_type is str:
+        try:
+            return float(value.replace(',', '').strip())
+        except ValueError:
+            return default
+    return default
+
 class BillProcessor:
     """Handles bill processing including text extraction and AI analysis."""
     
@@ -21,9 +65,17 @@ class BillProcessor:
     
     def process_bill(self, file_path: str) -> Dict[str, Any]:
         """Main processing function for bills."""
+        return self._process(file_path, file_path)
+    
+    def process_bill_stream(self, stream: BinaryIO, filename: str) -> Dict[str, Any]:
+        """Process a bill held in memory; the filename is only used for its extension."""
+        return self._process(stream, filename)
+    
+    def _process(self, source: Union[str, BinaryIO], filename: str) -> Dict[str, Any]:
+        """Extract and analyze a bill from a file path or a binary stream."""
         try:
             # Extract text from file
-            text = self._extract_text(file_path)
+            text = self._extract_text(source, filename)
             if not text.strip():
                 return {
                     'success': False,
@@ -32,8 +84,17 @@ class BillProcessor:
             
             logger.info(f"Extracted text length: {len(text)} characters")
             
-            # Analyze with Claude
-            analysis = self._analyze_with_claude(text)
+            # Analyze with Claude, unless this exact input was analyzed recently
+            cache_key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+            analysis = _cached_analysis(cache_key)
+            
+            if analysis is None:
+                analysis = self._analyze_with_claude(text)
+                # Don't cache fallback responses so a later upload can retry
+                if 'raw_response' not in analysis:
+                    _cache_analysis(cache_key, analysis)
+            else:
+                logger.info("Using cached analysis")
             
             return {
                 'success': True,
@@ -47,34 +108,66 @@ class BillProcessor:
                 'error': str(e)
             }
     
-    def _extract_text(self, file_path: str) -> str:
+    def _extract_text(self, source: Union[str, BinaryIO], filename: str) -> str:
         """Extract text from PDF or image file."""
-        file_extension = os.path.splitext(file_path)[1].lower()
+        file_extension = os.path.splitext(filename)[1].lower()
         
         if file_extension == '.pdf':
-            return self._extract_text_from_pdf(file_path)
+            return self._extract_text_from_pdf(source)
         else:
-            return self._extract_text_from_image(file_path)
+            return self._extract_text_from_image(source)
     
-    def _extract_text_from_pdf(self, file_path: str) -> str:
-        """Extract text from PDF using PyMuPDF."""
+    def _extract_text_from_pdf(self, source: Union[str, BinaryIO]) -> str:
+        """Extract text from PDF using PyMuPDF, falling back to OCR for scanned PDFs."""
         try:
-            doc = fitz.open(file_path)
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            doc.close()
-            return text
+            if isinstance(source, str):
+                doc = fitz.open(source)
+            else:
+                doc = fitz.open(stream=source.read(), filetype="pdf")
+            with doc:
+                parts = [page.get_text("text", flags=_PDF_TEXT_FLAGS) for page in doc]
+                if sum(len(part.strip()) for part in parts) < 40:
+                    # No usable text layer: treat as a scanned PDF
+                    return self._ocr_pdf_pages(doc)
+                return "".join(parts)
         except Exception as e:
             logger.error(f"Error extracting text from PDF: {str(e)}")
             raise Exception(f"Failed to extract text from PDF: {str(e)}")
     
-    def _extract_text_from_image(self, file_path: str) -> str:
+    def _ocr_pdf_pages(self, doc) -> str:
+        """Rasterize each PDF page and OCR the pages in parallel."""
+        # MuPDF is not thread-safe, so render on this thread; Tesseract runs
+        # outside the GIL, so the OCR itself fans out across cores
+        images = []
+        for page in doc:
+            pix = page.get_pixmap(dpi=200, colorspace=fitz.csGRAY)
+            images.append(Image.frombytes("L", (pix.width, pix.height), pix.samples))
+        
+        if len(images) == 1:
+            return self._ocr_image(images[0])
+        
+        with ThreadPoolExecutor(max_workers=min(len(images), os.cpu_count() or 1)) as executor:
+            return "\n".join(executor.map(self._ocr_image, images))
+    
+    def _ocr_image(self, image: Image.Image) -> str:
+        """Run Tesseract on a grayscale copy of the image capped at _OCR_MAX_EDGE pixels."""
+        image = image.convert("L")
+        width, height = image.size
+        scale = _OCR_MAX_EDGE / max(width, height)
+        if scale < 1:
+            image = image.resize((int(width * scale), int(height * scale)), Image.LANCZOS)
+        return pytesseract.image_to_string(
+            image,
+            lang=Config.TESSERACT_LANG,
+            config="--oem 1 --psm 6",
+            timeout=Config.TESSERACT_TIMEOUT
+        )
+    
+    def _extract_text_from_image(self, source: Union[str, BinaryIO]) -> str:
         """Extract text from image using Tesseract OCR."""
         try:
-            image = Image.open(file_path)
-            text = pytesseract.image_to_string(image)
-            return text
+            with Image.open(source) as image:
+                return self._ocr_image(image)
         except Exception as e:
             logger.error(f"Error extracting text from image: {str(e)}")
             raise Exception(f"Failed to extract text from image: {str(e)}")
@@ -82,51 +175,10 @@ class BillProcessor:
     def _analyze_with_claude(self, text: str) -> Dict[str, Any]:
         """Analyze extracted text with Claude AI."""
         try:
-            # Detect language first
-            language_prompt = f"""
-            Detect the language of this bill text and respond with just the language name in English:
-            
-            {text[:500]}
-            """
-            
-            # Headers for API call
-            headers = {
-                "Content-Type": "application/json",
-                "x-api-key": self.api_key,
-                "anthropic-version": "2023-06-01"
-            }
-            
-            # Language detection call
-            language_data = {
-                "model": self.model,
-                "max_tokens": 50,
-                "messages": [{
-                    "role": "user",
-                    "content": language_prompt
-                }]
-            }
-            
-            language_response = requests.post(
-                "https://api.anthropic.com/v1/messages",
-                headers=headers,
-                json=language_data
-            )
-            
-            if language_response.status_code == 200:
-                lang_resp_json = language_response.json()
-                lang_content = lang_resp_json.get("content", [])
-                detected_language = ""
-                for item in lang_content:
-                    if item.get("type") == "text":
-                        detected_language += item.get("text", "")
-                detected_language = detected_language.strip()
-            else:
-                detected_language = "English"
-            
-            logger.info(f"Detected language: {detected_language}")
-            
-            # Main analysis prompt
-            analysis_prompt = self._get_analysis_prompt(text, detected_language)
+            # Single call: Claude detects the language and analyzes the bill
+            # in the same response, saving a full round-trip per bill
+            text = truncate_to_token_budget(text, Config.MAX_INPUT_TOKENS)
+            analysis_prompt = self._get_analysis_prompt(text)
             
             # Analysis call
             analysis_data = {
@@ -138,106 +190,87 @@ class BillProcessor:
                 }]
             }
             
-            response = requests.post(
-                "https://api.anthropic.com/v1/messages",
-                headers=headers,
-                json=analysis_data
-            )
+            response = self._post_analysis(orjson.dumps(analysis_data))
             
             if response.status_code != 200:
                 raise Exception(f"API Error: {response.status_code} - {response.text}")
             
             # Parse the response
-            resp_json = response.json()
+            resp_json = orjson.loads(response.content)
             content = resp_json.get("content", [])
-            analysis_text = ""
-            for item in content:
-                if item.get("type") == "text":
-                    analysis_text += item.get("text", "")
+            analysis_text = "".join(item.get("text", "") for item in content if item.get("type") == "text")
             
-            return self._parse_claude_response(analysis_text, detected_language)
+            return self._parse_claude_response(analysis_text)
             
         except Exception as e:
             logger.error(f"Error analyzing with Claude: {str(e)}")
             raise Exception(f"Failed to analyze bill: {str(e)}")
     
-    def _get_analysis_prompt(self, text: str, language: str) -> str:
+    @retry_with_backoff(base_delay=2.0)
+    def _post_analysis(self, payload: bytes):
+        """POST a serialized analysis request, backing off while rate limited or overloaded."""
+        return _SESSION.post(
+            "https://api.anthropic.com/v1/messages",
+            headers={"x-api-key": self.api_key},
+            data=payload,
+            timeout=(5, 120)
+        )
+    
+    def _get_analysis_prompt(self, text: str) -> str:
         """Generate the analysis prompt for Claude."""
-        if language.lower() in ['spanish', 'español']:
-            return f"""
-            Analiza esta factura/recibo y proporciona un análisis estructurado. Responde en español.
-            
-            Texto de la factura:
-            {text}
-            
-            Por favor, proporciona tu respuesta en el siguiente formato JSON:
-            {{
-                "items": [
-                    {{
-                        "name": "Nombre del artículo",
-                        "amount": 0.00,
-                        "category": "Categoría",
-                        "notes": "Notas sobre este artículo"
-                    }}
-                ],
-                "total": 0.00,
-                "currency": "Moneda detectada",
-                "summary": "Resumen del análisis",
-                "observations": "Observaciones importantes",
-                "suggestions": "Sugerencias para el usuario"
-            }}
-            
-            Categorías sugeridas: Servicios Públicos, Alimentación, Suscripciones, Transporte, Entretenimiento, Salud, Educación, Hogar, Desconocido
-            
-            Para las notas, incluye comentarios como "tarifa estándar", "más alto de lo usual", "cargo sospechoso", etc.
-            """
-        else:
-            return f"""
-            Analyze this bill/receipt and provide a structured analysis. Respond in English.
-            
-            Bill text:
-            {text}
-            
-            Please provide your response in the following JSON format:
-            {{
-                "items": [
-                    {{
-                        "name": "Item name",
-                        "amount": 0.00,
-                        "category": "Category",
-                        "notes": "Notes about this item"
-                    }}
-                ],
-                "total": 0.00,
-                "currency": "Detected currency",
-                "summary": "Summary of the analysis",
-                "observations": "Important observations",
-                "suggestions": "Suggestions for the user"
-            }}
-            
-            Suggested categories: Utilities, Grocery, Subscription, Transportation, Entertainment, Healthcare, Education, Home, Unknown
-            
-            For notes, include comments like "standard rate", "higher than usual", "suspicious charge", etc.
-            """
+        return f"""
+        Analyze this bill/receipt and provide a structured analysis.
+        
+        First detect the language of the bill text. If the bill is in Spanish, write every
+        text value (item names, categories, notes, summary, observations, suggestions) in Spanish.
+        Otherwise write them in English.
+        
+        Bill text:
+        {text}
+        
+        Please provide your response in the following JSON format:
+        {{
+            "language": "Detected language name in English (e.g. English, Spanish)",
+            "items": [
+                {{
+                    "name": "Item name",
+                    "amount": 0.00,
+                    "category": "Category",
+                    "notes": "Notes about this item"
+                }}
+            ],
+            "total": 0.00,
+            "currency": "Detected currency",
+            "summary": "Summary of the analysis",
+            "observations": "Important observations",
+            "suggestions": "Suggestions for the user"
+        }}
+        
+        Suggested categories in English: Utilities, Grocery, Subscription, Transportation, Entertainment, Healthcare, Education, Home, Unknown
+        Suggested categories in Spanish: Servicios Públicos, Alimentación, Suscripciones, Transporte, Entretenimiento, Salud, Educación, Hogar, Desconocido
+        
+        For notes, include comments like "standard rate", "higher than usual", "suspicious charge", etc. (or their Spanish equivalents).
+        """
     
-    def _parse_claude_response(self, response_text: str, language: str) -> Dict[str, Any]:
+    def _parse_claude_response(self, response_text: str) -> Dict[str, Any]:
         """Parse Claude's response and extract JSON data."""
         try:
             # Try to extract JSON from the response
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-                data = json.loads(json_str)
+            json_str = extract_json(response_text)
+            if json_str:
+                data = orjson.loads(json_str)
+                language = str(data.get('language') or 'English').strip()
+                logger.info(f"Detected language: {language}")
                 
                 # Validate and clean the data
                 return self._validate_and_clean_data(data, language)
             else:
                 # If no JSON found, create a basic structure
-                return self._create_fallback_response(response_text, language)
+                return self._create_fallback_response(response_text, 'English')
                 
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"Error parsing JSON response: {str(e)}")
-            return self._create_fallback_response(response_text, language)
+            return self._create_fallback_response(response_text, 'English')
     
     def _validate_and_clean_data(self, data: Dict[str, Any], language: str) -> Dict[str, Any]:
         """Validate and clean the parsed data."""
@@ -253,22 +286,21 @@ class BillProcessor:
         
         # Clean items
         for item in data.get('items', []):
-            try:
-                cleaned_item = {
-                    'name': str(item.get('name', 'Unknown')),
-                    'amount': float(item.get('amount', 0.0)),
-                    'category': str(item.get('category', 'Unknown')),
-                    'notes': str(item.get('notes', ''))
-                }
-                cleaned_data['items'].append(cleaned_item)
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Skipping invalid item: {item}, error: {str(e)}")
+            if not isinstance(item, dict):
+                logger.warning(f"Skipping invalid item: {item}")
+                continue
+            cleaned_data['items'].append({
+                'name': str(item.get('name', 'Unknown')),
+                'amount': _as_float(item.get('amount', 0.0)),
+                'category': str(item.get('category', 'Unknown')),
+                'notes': str(item.get('notes', ''))
+            })
         
-        # Calculate total
-        try:
-            cleaned_data['total'] = float(data.get('total', 0.0))
-        except (ValueError, TypeError):
-            cleaned_data['total'] = sum(item['amount'] for item in cleaned_data['items'])
+        # Use the reported total, or add up the items if it is missing or invalid
+        total = _as_float(data.get('total'), default=None)
+        if total is None:
+            total = math.fsum(item['amount'] for item in cleaned_data['items'])
+        cleaned_data['total'] = total
         
         return cleaned_data
     
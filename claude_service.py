@@ -1,5 +1,56 @@
+import io
 import re
+import orjson
+import asyncio
+import hashlib
+import threading
+import contextlib
+from types import MappingProxyType
+from collections import OrderedDict
+import urllib3
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from config import Config
+from helpers import create_async_client, retry_with_backoff
+
+GREETING = "¡Hola! ¿En qué puedo ayudarte hoy? 😊"
+
+MESSAGES_URL = "https://api.anthropic.com/v1/messages"
+
+# System message (marked for prompt caching), serialized once at import;
+# orjson splices the pre-encoded bytes into every request body as-is
+_SYSTEM_PROMPT = orjson.Fragment(orjson.dumps([{
+    "type": "text",
+    "text": (
+        "You are an AI assistant named Flooky.You should never claim to be Claude, ChatGPT, or any other AI. Always respond in whatever language. You are genius in everything specially in IT."
+    ),
+    "cache_control": {"type": "ephemeral"}
+}]))
+
+# Chat turns go straight through a urllib3 pool, skipping the per-call session,
+# cookie and redirect handling requests would add on the hot path
+_POOL = urllib3.PoolManager(
+    num_pools=4,
+    maxsize=256,
+    retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2),
+    timeout=urllib3.Timeout(connect=5, read=90)
+)
+
+# requests session for the health check, and default headers for the async client
+_SESSION = requests.Session()
+_SESSION.headers.update({
+    "Content-Type": "application/json",
+    "anthropic-version": "2023-06-01",
+    "anthropic-beta": "prompt-caching-2024-07-31"
+})
+# Transport-level retries only cover failed connects; rate limits are handled
+# by retry_with_backoff so Retry-After is honored with jitter
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=256,
+    max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2)
+))
 
 class ClaudeService:
     """Service for interacting with the Claude API."""
@@ -10,92 +61,215 @@ class ClaudeService:
         self.model = "claude-3-5-haiku-20241022"  # Keep the model as specified in your code
         self.max_tokens = Config.MAX_TOKENS
         self.temperature = 1  # As specified in your prompt
+        # Built once and frozen: the same header and payload views are reused on every call
+        self._headers = MappingProxyType({**_SESSION.headers, "x-api-key": self.api_key})
+        self._auth_headers = MappingProxyType({"x-api-key": self.api_key})
+        self._base_payload = MappingProxyType({
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature
+        })
+        # Exact-match LRU of recent replies, keyed on a hash of the messages
+        self._cache = OrderedDict()
+        self._cache_maxsize = 1024
+        self._cache_lock = threading.Lock()
     
     def get_response(self, conversation):
         """
         Get a response from Claude based on the conversation history.
         
         Args:
-            conversation (list): List of message dicts with 'role' and 'content'
+            conversation (list): User/assistant message dicts, as returned by
+                ConversationManager.get_conversation_for_claude()
             
         Returns:
             str: Claude's response text
         """
+        buffer = io.StringIO()
+        for chunk in self.stream_response(conversation):
+            buffer.write(chunk)
+        return buffer.getvalue()
+    
+    def stream_response(self, conversation):
+        """
+        Stream a response from Claude, yielding text as it is generated.
+        
+        Args:
+            conversation (list): User/assistant message dicts, as returned by
+                ConversationManager.get_conversation_for_claude()
+            
+        Yields:
+            str: Chunks of Claude's response text
+        """
         try:
-            # Check if there are any user messages
-            user_messages = [msg for msg in conversation if msg["role"] == "user"]
-            if not user_messages:
-                return "¡Hola! ¿En qué puedo ayudarte hoy? 😊"
+            data = self._build_payload(conversation)
+            if data is None:
+                yield GREETING
+                return
+            data["stream"] = True
             
-            # Format system message
-            system_message = (
-                "You are an AI assistant named Flooky.You should never claim to be Claude, ChatGPT, or any other AI. Always respond in whatever language. You are genius in everything specially in IT."
-
-            )
+            key = self._cache_key(data["messages"])
+            cached = self._cache_get(key)
+            if cached is not None:
+                yield cached
+                return
+            parts = []
             
-            # Make API call using requests directly
-            import requests
-            import json
+            # Make the API call using the Messages API
+            response = self._post_messages(data, stream=True)
+            try:
+                # Check response status
+                if response.status != 200:
+                    error_details = response.data.decode('utf-8', errors='replace')
+                    print(f"API Error: {response.status} - {error_details}")
+                    yield f"Error: API request failed with status {response.status}. Details: {error_details}"
+                    return
+                
+                # Server-sent events: only the "data:" lines carry payloads
+                for line in response:
+                    if not line.startswith(b"data:"):
+                        continue
+                    event = orjson.loads(line[5:])
+                    if event.get("type") == "content_block_delta":
+                        delta = event.get("delta", {})
+                        if delta.get("type") == "text_delta":
+                            parts.append(delta.get("text", ""))
+                            yield parts[-1]
+                    elif event.get("type") == "error":
+                        raise Exception(event.get("error", {}).get("message", "stream error"))
+            finally:
+                response.release_conn()
             
-            # Headers for API call - Updated for Messages API
-            headers = {
-                "Content-Type": "application/json",
-                "x-api-key": self.api_key,
-                "anthropic-version": "2023-06-01"
-            }
+            self._cache_put(key, "".join(parts))
             
-            # Prepare the messages array for Claude's Messages API
-            messages = []
+        except Exception as e:
+            # Return a user-friendly error
+            error_message = f"Error: {str(e)}"
+            print(error_message)
+            yield f"Lo siento, estoy teniendo problemas técnicos. 😔 {error_message}"
+    
+    async def aget_response(self, conversation, client, semaphore=None):
+        """
+        Async version of get_response for running many conversations concurrently.
+        
+        Args:
+            conversation (list): User/assistant message dicts, as returned by
+                ConversationManager.get_conversation_for_claude()
+            client (httpx.AsyncClient): Client from create_async_client()
+            semaphore (asyncio.Semaphore, optional): Bounds concurrent API calls
             
-            # Add all conversation history (excluding system messages)
-            for msg in conversation:
-                if msg["role"] != "system":
-                    messages.append({
-                        "role": msg["role"],
-                        "content": msg["content"]
-                    })
+        Returns:
+            str: Claude's response text
+        """
+        try:
+            data = self._build_payload(conversation)
+            if data is None:
+                return GREETING
             
-            # Data payload for the Messages API format
-            data = {
-                "model": self.model,
-                "system": system_message,  # System message as a separate parameter
-                "messages": messages,
-                "max_tokens": self.max_tokens,
-                "temperature": self.temperature
-            }
+            key = self._cache_key(data["messages"])
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
             
-            # Make the API call using the Messages API
-            response = requests.post(
-                "https://api.anthropic.com/v1/messages",
-                headers=headers,
-                json=data
-            )
+            response = await self._apost_messages(client, data, semaphore)
             
-            # Check response status
             if response.status_code != 200:
                 print(f"API Error: {response.status_code} - {response.text}")
-                error_details = response.text
-                return f"Error: API request failed with status {response.status_code}. Details: {error_details}"
-            
-            # Parse the response
-            resp_json = response.json()
-            
-            # Extract content from the Messages API response
-            content = resp_json.get("content", [])
-            raw_response = ""
-            
-            for item in content:
-                if item.get("type") == "text":
-                    raw_response += item.get("text", "")
+                return f"Error: API request failed with status {response.status_code}. Details: {response.text}"
             
-            return raw_response
+            reply = self._extract_text(orjson.loads(response.content))
+            self._cache_put(key, reply)
+            return reply
             
         except Exception as e:
-            # Return a user-friendly error
             error_message = f"Error: {str(e)}"
             print(error_message)
             return f"Lo siento, estoy teniendo problemas técnicos. 😔 {error_message}"
     
+    def get_responses(self, conversations):
+        """
+        Get responses for several conversations at once.
+        
+        Args:
+            conversations (list): List of conversations, as for get_response
+            
+        Returns:
+            list: Claude's response text for each conversation, in order
+        """
+        async def run():
+            semaphore = asyncio.Semaphore(Config.CLAUDE_MAX_CONCURRENCY)
+            async with create_async_client(_SESSION.headers) as client:
+                return await asyncio.gather(*[
+                    self.aget_response(conversation, client, semaphore)
+                    for conversation in conversations
+                ])
+        
+        return asyncio.run(run())
+    
+    @retry_with_backoff()
+    def _post_messages(self, data, stream=False):
+        """POST to the Messages API, retrying rate-limited and overloaded responses."""
+        return _POOL.request(
+            "POST",
+            MESSAGES_URL,
+            body=orjson.dumps(data),
+            headers=self._headers,
+            preload_content=not stream
+        )
+    
+    @retry_with_backoff()
+    async def _apost_messages(self, client, data, semaphore=None):
+        """Async version of _post_messages for the httpx client."""
+        # The slot is taken per attempt, so backoff sleeps don't hold it
+        async with semaphore or contextlib.nullcontext():
+            return await client.post(
+                MESSAGES_URL,
+                headers=self._auth_headers,
+                content=orjson.dumps(data)
+            )
+    
+    def _build_payload(self, conversation):
+        """Build the Messages API payload, or None if there is no user message yet."""
+        # The conversation holds only user/assistant turns (the system prompt is
+        # sent separately), so an empty one means the user hasn't spoken yet
+        if not conversation:
+            return None
+        
+        # Data payload for the Messages API format
+        return {
+            **self._base_payload,
+            "system": _SYSTEM_PROMPT,  # System message as a separate parameter
+            "messages": conversation
+        }
+    
+    def _cache_key(self, messages):
+        """Hash the messages sent to Claude into a compact cache key."""
+        serialized = orjson.dumps(messages, option=orjson.OPT_SORT_KEYS)
+        return hashlib.blake2b(serialized, digest_size=16).hexdigest()
+    
+    def _cache_get(self, key):
+        """Return a cached reply and mark it as recently used, or None."""
+        with self._cache_lock:
+            reply = self._cache.get(key)
+            if reply is not None:
+                self._cache.move_to_end(key)
+            return reply
+    
+    def _cache_put(self, key, reply):
+        """Store a reply, evicting the least recently used one when full."""
+        if not reply:
+            return
+        with self._cache_lock:
+            self._cache[key] = reply
+            self._cache.move_to_end(key)
+            if len(self._cache) > self._cache_maxsize:
+                self._cache.popitem(last=False)
+    
+    def _extract_text(self, resp_json):
+        """Concatenate the text blocks of a Messages API response."""
+        content = resp_json.get("content", [])
+        return "".join(item.get("text", "") for item in content if item.get("type") == "text")
+    
     def health_check(self):
         """
         Check if the Claude API is accessible.
@@ -105,14 +279,6 @@ class ClaudeService:
         """
         try:
             # Make a simple API call to check health
-            import requests
-            
-            headers = {
-                "Content-Type": "application/json",
-                "x-api-key": self.api_key,
-                "anthropic-version": "2023-06-01"
-            }
-            
             data = {
                 "model": self.model,
                 "messages": [
@@ -124,10 +290,10 @@ class ClaudeService:
                 "max_tokens": 10
             }
             
-            response = requests.post(
-                "https://api.anthropic.com/v1/messages",
-                headers=headers,
-                json=data
+            response = _SESSION.post(
+                MESSAGES_URL,
+                headers=self._auth_headers,
+                data=orjson.dumps(data)
             )
             
             return response.status_code == 200
@@ -15,11 +15,48 @@ class Config:
     CLAUDE_API_KEY = os.environ.get('CLAUDE_API_KEY')
     # Model is hard-coded in claude_service.py to match your prompt
     MAX_TOKENS = int(os.environ.get('MAX_TOKENS', '40000'))  # Updated to match your prompt
+    # Upper bound on simultaneous Claude requests from one batch (match your rate-limit tier)
+    CLAUDE_MAX_CONCURRENCY = int(os.environ.get('CLAUDE_MAX_CONCURRENCY', '5'))
+    # Longer document text is trimmed to its head and tail before it is sent
+    MAX_INPUT_TOKENS = int(os.environ.get('MAX_INPUT_TOKENS', '8000'))
+    # Longer contracts are summarized section by section before the final analysis
+    MAX_PROMPT_CHARS = int(os.environ.get('MAX_PROMPT_CHARS', '60000'))
+    
+    # sqlite file tracking submitted Message Batches jobs
+    BATCH_DB_PATH = os.environ.get('BATCH_DB_PATH', 'data/batches.db')
+    # CV screening runs with at least this many files go through the Batches API
+    HR_BATCH_MIN_FILES = int(os.environ.get('HR_BATCH_MIN_FILES', '10'))
+    # sqlite file caching model outputs, and how long entries stay valid (seconds, 0 keeps them)
+    LLM_CACHE_PATH = os.environ.get('LLM_CACHE_PATH', 'data/llm_cache.db')
+    LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', str(7 * 24 * 3600)))
+    # Send the original long-form video fact-check prompt instead of the condensed one
+    VIDEO_VERBOSE_PROMPT = os.environ.get('VIDEO_VERBOSE_PROMPT', 'False').lower() in ('true', '1', 't')
+    # Model for video fact-checks (overloaded requests fall back to a smaller one)
+    VIDEO_ANALYSIS_MODEL = os.environ.get('VIDEO_ANALYSIS_MODEL', 'claude-3-5-haiku-20241022')
     
     # Application settings
     MAX_CONVERSATION_HISTORY = int(os.environ.get('MAX_CONVERSATION_HISTORY', '10'))
+    # Idle conversations expire after this many seconds; at most MAX_CONVERSATIONS are kept
+    CONVERSATION_TTL = int(os.environ.get('CONVERSATION_TTL', '3600'))
+    MAX_CONVERSATIONS = int(os.environ.get('MAX_CONVERSATIONS', '10000'))
+    # Set to share conversations between worker processes through Redis (e.g. redis://localhost:6379/0)
+    REDIS_URL = os.environ.get('REDIS_URL')
     LOG_CONVERSATIONS = os.environ.get('LOG_CONVERSATIONS', 'True').lower() in ('true', '1', 't')
     
+    # Speech recognition settings ("auto" lets CTranslate2 pick the fastest option per device)
+    WHISPER_MODEL_SIZE = os.environ.get('WHISPER_MODEL_SIZE', 'base')
+    WHISPER_DEVICE = os.environ.get('WHISPER_DEVICE', 'auto')
+    WHISPER_COMPUTE_TYPE = os.environ.get('WHISPER_COMPUTE', 'auto')
+    # Load the video analyzer's Whisper model at startup rather than on the first video
+    WHISPER_PRELOAD = os.environ.get('WHISPER_PRELOAD', 'True').lower() in ('true', '1', 't')
+    
+    # OCR settings (timeout in seconds, 0 disables it)
+    TESSERACT_LANG = os.environ.get('TESS_LANG', 'eng+spa')
+    TESSERACT_TIMEOUT = int(os.environ.get('TESSERACT_TIMEOUT', '60'))
+    
+    # Number of server worker processes sharing this machine's cores (gunicorn's convention)
+    WORKER_PROCESSES = max(1, int(os.environ.get('WEB_CONCURRENCY', '1')))
+    
     # Check required environment variables
     @classmethod
     def validate(cls):
@@ -1,6 +1,23 @@
+import time
+import threading
+from collections import deque
 from datetime import datetime
+from cachetools import TTLCache
 from config import Config
 
+class _Conversation:
+    """One user's history: pinned system message plus a bounded window of turns."""
+    
+    __slots__ = ('system', 'system_timestamp', 'messages', 'timestamps')
+    
+    def __init__(self, max_history):
+        # Timestamps (time.time_ns()) sit in parallel deques so the message
+        # dicts carry only what the Claude API needs
+        self.system = None
+        self.system_timestamp = None
+        self.messages = deque(maxlen=max_history)
+        self.timestamps = deque(maxlen=max_history)
+
 class ConversationManager:
     """Manages chat conversation history."""
     
@@ -8,7 +25,11 @@ class ConversationManager:
         """Initialize the conversation manager."""
         # In-memory storage for conversations
         # In a production app, this should use a database
-        self.conversations = {}
+        # Idle users expire after CONVERSATION_TTL seconds and the least
+        # recently used are dropped past MAX_CONVERSATIONS, so memory stays
+        # bounded by the number of active users
+        self.conversations = TTLCache(maxsize=Config.MAX_CONVERSATIONS, ttl=Config.CONVERSATION_TTL)
+        self._lock = threading.Lock()
         self.max_history = Config.MAX_CONVERSATION_HISTORY
     
     def create_conversation(self, user_id, system_message=None):
@@ -22,18 +43,16 @@ class ConversationManager:
         Returns:
             list: The new conversation
         """
-        conversation = []
+        conversation = _Conversation(self.max_history)
         
         # Add system message if provided
         if system_message:
-            conversation.append({
-                "role": "system",
-                "content": system_message,
-                "timestamp": datetime.now().isoformat()
-            })
+            conversation.system = {"role": "system", "content": system_message}
+            conversation.system_timestamp = time.time_ns()
         
-        self.conversations[user_id] = conversation
-        return conversation
+        with self._lock:
+            self.conversations[user_id] = conversation
+        return self._as_list(conversation)
     
     def get_conversation(self, user_id):
         """
@@ -45,7 +64,11 @@ class ConversationManager:
         Returns:
             list: Conversation history or None if not found
         """
-        return self.conversations.get(user_id)
+        with self._lock:
+            conversation = self.conversations.get(user_id)
+            if conversation is None:
+                return None
+            return self._as_list(conversation)
     
     def add_message(self, user_id, role, content):
         """
@@ -59,26 +82,205 @@ class ConversationManager:
         Returns:
             list: Updated conversation
         """
-        if user_id not in self.conversations:
-            self.create_conversation(user_id)
-        
-        # Add the new message
-        self.conversations[user_id].append({
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        # Trim conversation if it exceeds max history (but keep system message)
-        conversation = self.conversations[user_id]
-        if len(conversation) > self.max_history + 1:
-            # Keep the system message (if any) at index 0
-            if conversation[0]["role"] == "system":
-                self.conversations[user_id] = [conversation[0]] + conversation[-(self.max_history):]
+        message = {"role": role, "content": content}
+        timestamp = time.time_ns()
+        
+        with self._lock:
+            conversation = self.conversations.get(user_id)
+            if conversation is None:
+                conversation = _Conversation(self.max_history)
+            
+            # The system message is pinned; everything else goes through the
+            # deque, which drops the oldest turn once max history is reached
+            if role == "system":
+                conversation.system = message
+                conversation.system_timestamp = timestamp
             else:
-                self.conversations[user_id] = conversation[-(self.max_history):]
+                conversation.messages.append(message)
+                conversation.timestamps.append(timestamp)
+            
+            # Re-inserting restarts the idle timer
+            self.conversations[user_id] = conversation
+            return self._as_list(conversation)
+    
+    def delete_conversation(self, user_id):
+        """
+        Delete a user's conversation history.
+        
+        Args:
+            user_id (str): Unique identifier for the user
+            
+        Returns:
+            bool: True if deleted, False if not found
+        """
+        with self._lock:
+            return self.conversations.pop(user_id, None) is not None
+    
+    def get_conversation_for_claude(self, user_id):
+        """
+        Get the conversation in the format expected by Claude API.
         
-        return self.conversations[user_id]
+        Args:
+            user_id (str): Unique identifier for the user
+            
+        Returns:
+            list: User and assistant messages formatted for Claude API
+        """
+        # Messages are stored in the API shape already, and the system message
+        # is kept out of band since the Messages API takes it separately
+        with self._lock:
+            conversation = self.conversations.get(user_id)
+            if conversation is None:
+                return []
+            return list(conversation.messages)
+    
+    def get_timestamps(self, user_id):
+        """
+        Get the message timestamps for a user, aligned with get_conversation().
+        
+        Args:
+            user_id (str): Unique identifier for the user
+            
+        Returns:
+            list: ISO 8601 timestamp strings, or None if not found
+        """
+        with self._lock:
+            conversation = self.conversations.get(user_id)
+            if conversation is None:
+                return None
+            timestamps = list(conversation.timestamps)
+        
+        if conversation.system_timestamp:
+            timestamps.insert(0, conversation.system_timestamp)
+        return [datetime.fromtimestamp(ns / 1e9).isoformat() for ns in timestamps]
+    
+    def get_revision(self, user_id):
+        """
+        Get a cheap marker of a conversation's state, without copying its messages.
+        
+        Args:
+            user_id (str): Unique identifier for the user
+            
+        Returns:
+            tuple: (message count, newest time_ns), or None if not found
+        """
+        with self._lock:
+            conversation = self.conversations.get(user_id)
+            if conversation is None:
+                return None
+            newest = max(conversation.timestamps[-1] if conversation.timestamps else 0,
+                         conversation.system_timestamp or 0)
+            return len(conversation.messages) + (1 if conversation.system else 0), newest
+    
+    def _as_list(self, conversation):
+        """Flatten a conversation into the system message followed by its turns."""
+        if conversation.system:
+            return [conversation.system, *conversation.messages]
+        return list(conversation.messages)
+
+class RedisConversationManager:
+    """Conversation history stored in Redis so every worker process shares it."""
+    
+    def __init__(self, redis_url=None):
+        """Connect to Redis; the client and MessagePack are only needed in this mode."""
+        import redis
+        import msgpack
+        
+        self._msgpack = msgpack
+        self.redis = redis.Redis(connection_pool=redis.ConnectionPool.from_url(redis_url or Config.REDIS_URL))
+        self.max_history = Config.MAX_CONVERSATION_HISTORY
+        self.ttl = Config.CONVERSATION_TTL
+    
+    def _keys(self, user_id):
+        """Redis keys for a user's system message and dialog turns."""
+        return f"conv:{user_id}:system", f"conv:{user_id}"
+    
+    def _unpack_turns(self, packed_turns):
+        """Decode stored (role, content, timestamp) turns into messages and timestamps."""
+        turns = [self._msgpack.unpackb(packed) for packed in packed_turns]
+        messages = [{"role": role, "content": content} for role, content, _ in turns]
+        return messages, [timestamp for _, _, timestamp in turns]
+    
+    def _load(self, user_id):
+        """Fetch the system entry and dialog turns in one round trip."""
+        system_key, turns_key = self._keys(user_id)
+        with self.redis.pipeline(transaction=False) as pipe:
+            pipe.get(system_key)
+            pipe.lrange(turns_key, 0, -1)
+            packed_system, packed_turns = pipe.execute()
+        
+        if packed_system is None:
+            return None, None, None
+        return self._msgpack.unpackb(packed_system), *self._unpack_turns(packed_turns)
+    
+    def create_conversation(self, user_id, system_message=None):
+        """
+        Create a new conversation for a user.
+        
+        Args:
+            user_id (str): Unique identifier for the user
+            system_message (str, optional): System message for Claude
+            
+        Returns:
+            list: The new conversation
+        """
+        system_key, turns_key = self._keys(user_id)
+        # The system entry always exists (possibly empty) and marks the conversation as present
+        system = [system_message, time.time_ns()] if system_message else []
+        
+        with self.redis.pipeline() as pipe:
+            pipe.delete(turns_key)
+            pipe.set(system_key, self._msgpack.packb(system), ex=self.ttl)
+            pipe.execute()
+        
+        return [{"role": "system", "content": system_message}] if system_message else []
+    
+    def get_conversation(self, user_id):
+        """
+        Get the conversation history for a user.
+        
+        Args:
+            user_id (str): Unique identifier for the user
+            
+        Returns:
+            list: Conversation history or None if not found
+        """
+        system, messages, _ = self._load(user_id)
+        if system is None:
+            return None
+        if system:
+            return [{"role": "system", "content": system[0]}, *messages]
+        return messages
+    
+    def add_message(self, user_id, role, content):
+        """
+        Add a message to a user's conversation.
+        
+        Args:
+            user_id (str): Unique identifier for the user
+            role (str): Message role ('user', 'assistant', or 'system')
+            content (str): Message content
+            
+        Returns:
+            list: Updated conversation
+        """
+        system_key, turns_key = self._keys(user_id)
+        timestamp = time.time_ns()
+        
+        with self.redis.pipeline() as pipe:
+            if role == "system":
+                pipe.set(system_key, self._msgpack.packb([content, timestamp]), ex=self.ttl)
+            else:
+                # Keep the system entry so the conversation counts as present
+                pipe.set(system_key, self._msgpack.packb([]), ex=self.ttl, nx=True)
+                pipe.rpush(turns_key, self._msgpack.packb([role, content, timestamp]))
+                pipe.ltrim(turns_key, -self.max_history, -1)
+            # Any activity restarts the idle timer on both keys
+            pipe.expire(system_key, self.ttl)
+            pipe.expire(turns_key, self.ttl)
+            pipe.execute()
+        
+        return self.get_conversation(user_id)
     
     def delete_conversation(self, user_id):
         """
@@ -90,10 +292,8 @@ class ConversationManager:
         Returns:
             bool: True if deleted, False if not found
         """
-        if user_id in self.conversations:
-            del self.conversations[user_id]
-            return True
-        return False
+        system_key, turns_key = self._keys(user_id)
+        return self.redis.delete(system_key, turns_key) > 0
     
     def get_conversation_for_claude(self, user_id):
         """
@@ -103,14 +303,49 @@ class ConversationManager:
             user_id (str): Unique identifier for the user
             
         Returns:
-            list: Conversation formatted for Claude API
+            list: User and assistant messages formatted for Claude API
+        """
+        _, turns_key = self._keys(user_id)
+        messages, _ = self._unpack_turns(self.redis.lrange(turns_key, 0, -1))
+        return messages
+    
+    def get_timestamps(self, user_id):
+        """
+        Get the message timestamps for a user, aligned with get_conversation().
+        
+        Args:
+            user_id (str): Unique identifier for the user
+            
+        Returns:
+            list: ISO 8601 timestamp strings, or None if not found
+        """
+        system, _, timestamps = self._load(user_id)
+        if system is None:
+            return None
+        if system:
+            timestamps.insert(0, system[1])
+        return [datetime.fromtimestamp(ns / 1e9).isoformat() for ns in timestamps]
+    
+    def get_revision(self, user_id):
+        """
+        Get a cheap marker of a conversation's state, without fetching its messages.
+        
+        Args:
+            user_id (str): Unique identifier for the user
+            
+        Returns:
+            tuple: (message count, newest time_ns), or None if not found
         """
-        conversation = self.get_conversation(user_id)
-        if not conversation:
-            return []
+        system_key, turns_key = self._keys(user_id)
+        with self.redis.pipeline(transaction=False) as pipe:
+            pipe.get(system_key)
+            pipe.llen(turns_key)
+            pipe.lindex(turns_key, -1)
+            packed_system, turn_count, packed_last = pipe.execute()
         
-        # Format for Claude API (exclude timestamps)
-        return [
-            {"role": msg["role"], "content": msg["content"]}
-            for msg in conversation
-        ]
\ No newline at end of file
+        if packed_system is None:
+            return None
+        system = self._msgpack.unpackb(packed_system)
+        newest = max(self._msgpack.unpackb(packed_last)[2] if packed_last is not None else 0,
+                     system[1] if system else 0)
+        return turn_count + (1 if system else 0), newest
@@ -1,16 +1,185 @@
 import os
-import json
+import copy
+import orjson
+import asyncio
 import logging
+import hashlib
+import threading
 import csv
-from typing import Dict, List, Any
+from collections import deque
+from typing import Dict, List, Any, BinaryIO, Union
 import fitz  # PyMuPDF
-import requests
+from cachetools import TTLCache
 import re
 from datetime import datetime
 from config import Config
+from helpers import PROCESS_POOL_WORKERS, PROMPT_CACHING_HEADERS, anthropic_session, open_text, retry_with_backoff, create_async_client, extract_json, get_process_pool
 
 logger = logging.getLogger(__name__)
 
+# Shared with the other analyzers so Anthropic calls reuse pooled connections
+_SESSION = anthropic_session()
+
+# Analyses keyed by a hash of the extracted text, so re-uploads skip Claude
+_ANALYSIS_CACHE = TTLCache(maxsize=1024, ttl=86400)
+_ANALYSIS_CACHE_LOCK = threading.Lock()
+
+def _cached_analysis(cache_key):
+    """Return a private copy of a cached analysis, or None."""
+    with _ANALYSIS_CACHE_LOCK:
+        analysis = _ANALYSIS_CACHE.get(cache_key)
+    return copy.deepcopy(analysis) if analysis is not None else None
+
+def _cache_analysis(cache_key, analysis):
+    """Cache a copy of an analysis so callers can't alter what later hits see."""
+    analysis = copy.deepcopy(analysis)
+    with _ANALYSIS_CACHE_LOCK:
+        _ANALYSIS_CACHE[cache_key] = analysis
+
+# Delimiters recognised from the header row without sniffing
+_CSV_DELIMITERS = (',', ';', '\t', '|')
+# CSV rows are yielded in blocks of about this many characters, like the TXT reader
+_CSV_CHUNK_CHARS = 65536
+
+_JSON_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+# Marks where the middle of an over-long statement was dropped
+_WINDOW_SEPARATOR = "\n...\n"
+
+# Statement compaction: lines without a digit can't be transactions on their
+# own, but are often a transaction's merchant or description, printed on the
+# line(s) before its date and amount. Up to this many are carried onto the
+# next line with a digit; longer digitless runs are banners or small print.
+_WHITESPACE_RE = re.compile(r'\s+')
+_DIGIT_RE = re.compile(r'\d')
+_DESCRIPTION_LINES = 2
+
+# Static instructions and JSON schema for financial analysis. Sent as the
+# system block ahead of the statement, so it must stay byte-identical.
+SCHEMA_INSTRUCTIONS = """As an expert financial advisor, please analyze the bank statement data and financial goal the user provides and give comprehensive financial advice.
+
+Please provide your response in the following JSON format:
+{
+    "financial_overview": {
+        "total_income": 0.00,
+        "total_expenses": 0.00,
+        "net_savings": 0.00,
+        "analysis_period": "Last X months",
+        "average_monthly_income": 0.00,
+        "average_monthly_expenses": 0.00
+    },
+    "spending_breakdown": [
+        {
+            "category": "Housing/Rent",
+            "amount": 0.00,
+            "percentage": 0.0,
+            "frequency": "monthly",
+            "status": "normal/high/low"
+        }
+    ],
+    "income_sources": [
+        {
+            "source": "Salary",
+            "amount": 0.00,
+            "frequency": "monthly",
+            "stability": "stable/variable"
+        }
+    ],
+    "financial_habits": {
+        "good_habits": [
+            "List of positive financial behaviors observed"
+        ],
+        "bad_habits": [
+            "List of concerning spending patterns"
+        ],
+        "subscriptions": [
+            {
+                "service": "Service name",
+                "cost": 0.00,
+                "frequency": "monthly",
+                "necessity": "essential/useful/unnecessary"
+            }
+        ]
+    },
+    "goal_analysis": {
+        "goal": "The user's financial goal",
+        "target_amount": "The user's goal amount",
+        "timeframe": "The user's target timeframe",
+        "feasibility": "achievable/challenging/unrealistic",
+        "current_savings_rate": 0.0,
+        "required_savings_rate": 0.0,
+        "monthly_savings_needed": 0.00,
+        "time_to_reach_goal": "X months/years"
+    },
+    "recommendations": {
+        "stop_doing": [
+            {
+                "action": "Specific thing to stop",
+                "potential_savings": 0.00,
+                "impact": "high/medium/low"
+            }
+        ],
+        "start_doing": [
+            {
+                "action": "Specific thing to start",
+                "potential_benefit": 0.00,
+                "difficulty": "easy/medium/hard"
+            }
+        ],
+        "budget_suggestions": [
+            {
+                "category": "Category name",
+                "current_spending": 0.00,
+                "recommended_spending": 0.00,
+                "reason": "Why this change is recommended"
+            }
+        ]
+    },
+    "action_plan": {
+        "immediate_actions": [
+            "Actions to take in the next 30 days"
+        ],
+        "short_term_goals": [
+            "Goals for next 3-6 months"
+        ],
+        "long_term_strategy": [
+            "Long-term financial strategy"
+        ]
+    },
+    "income_optimization": [
+        {
+            "suggestion": "How to increase income",
+            "potential_increase": 0.00,
+            "effort_required": "low/medium/high",
+            "timeframe": "immediate/short-term/long-term"
+        }
+    ],
+    "risk_assessment": {
+        "emergency_fund_status": "adequate/insufficient/none",
+        "financial_stability": "stable/at-risk/unstable",
+        "debt_situation": "none/manageable/concerning/critical",
+        "recommendations": "Overall risk mitigation advice"
+    },
+    "personalized_insights": "Detailed, personalized advice based on the user's specific situation and goals"
+}
+
+Analyze spending patterns, identify trends, calculate percentages, and provide actionable advice. Be specific with numbers and realistic with recommendations. Consider the user's goal and provide a clear path to achieve it."""
+
+# MuPDF is not thread-safe, so long statements are split into contiguous page
+# ranges and extracted in the shared worker processes, each opening its own
+# document. The workers skip app.init_services(), so starting them only costs
+# the module imports, not a Whisper model load per process.
+_PARALLEL_MIN_PAGES = 64
+
+def _extract_page_range(source: Union[str, bytes], start: int, stop: int) -> str:
+    """Worker process: open the PDF independently and extract pages [start, stop)."""
+    if isinstance(source, str):
+        doc = fitz.open(source)
+    else:
+        doc = fitz.open(stream=source, filetype="pdf")
+    with doc:
+        return "".join(doc[number].get_text("text") for number in range(start, stop))
+
 class FinancialProcessor:
     """Handles bank statement processing and financial analysis."""
     
@@ -21,19 +190,36 @@ class FinancialProcessor:
     
     def process_financial_data(self, file_path: str, financial_goal: str, goal_amount: str = "", goal_timeframe: str = "") -> Dict[str, Any]:
         """Main processing function for financial analysis."""
+        return self._process(file_path, file_path, financial_goal, goal_amount, goal_timeframe)
+    
+    def process_financial_data_stream(self, stream: BinaryIO, filename: str, financial_goal: str, goal_amount: str = "", goal_timeframe: str = "") -> Dict[str, Any]:
+        """Process a bank statement held in memory; the filename is only used for its extension."""
+        return self._process(stream, filename, financial_goal, goal_amount, goal_timeframe)
+    
+    def _process(self, source: Union[str, BinaryIO], filename: str, financial_goal: str, goal_amount: str = "", goal_timeframe: str = "") -> Dict[str, Any]:
+        """Extract and analyze a bank statement from a file path or a binary stream."""
         try:
-            # Extract text from file
-            text = self._extract_text(file_path)
+            # Extract text from file; only a prompt-sized window is kept in memory
+            text, digest, total_chars = self._extract_text(source, filename)
             if not text.strip():
                 return {
                     'success': False,
                     'error': 'No data could be extracted from the file'
                 }
             
-            logger.info(f"Extracted financial data length: {len(text)} characters")
+            logger.info(f"Extracted financial data length: {total_chars} characters")
             
-            # Analyze with Claude
-            analysis = self._analyze_with_claude(text, financial_goal, goal_amount, goal_timeframe)
+            # Analyze with Claude, unless this exact input was analyzed recently
+            cache_key = (digest, financial_goal, goal_amount, goal_timeframe)
+            analysis = _cached_analysis(cache_key)
+            
+            if analysis is None:
+                analysis = self._analyze_with_claude(text, financial_goal, goal_amount, goal_timeframe)
+                # Don't cache fallback responses so a later upload can retry
+                if 'raw_response' not in analysis:
+                    _cache_analysis(cache_key, analysis)
+            else:
+                logger.info("Using cached analysis")
             
             return {
                 'success': True,
@@ -47,252 +233,353 @@ class FinancialProcessor:
                 'error': str(e)
             }
     
-    def _extract_text(self, file_path: str) -> str:
-        """Extract text from PDF, CSV or TXT file."""
-        file_extension = os.path.splitext(file_path)[1].lower()
+    def _extract_text(self, source: Union[str, BinaryIO], filename: str):
+        """Extract text from PDF, CSV or TXT file; returns (text window, sha256 of all text, total length)."""
+        file_extension = os.path.splitext(filename)[1].lower()
         
         if file_extension == '.pdf':
-            return self._extract_text_from_pdf(file_path)
+            chunks = self._extract_text_from_pdf(source)
         elif file_extension == '.csv':
-            return self._extract_text_from_csv(file_path)
+            chunks = self._extract_text_from_csv(source)
         elif file_extension == '.txt':
-            return self._extract_text_from_txt(file_path)
+            chunks = self._extract_text_from_txt(source)
         else:
             raise Exception(f"Unsupported file format: {file_extension}")
+        
+        return self._collect_window(self._compact_lines(chunks), Config.MAX_PROMPT_CHARS)
     
-    def _extract_text_from_pdf(self, file_path: str) -> str:
-        """Extract text from PDF using PyMuPDF."""
+    def _compact_lines(self, chunks):
+        """Collapse whitespace, drop blank lines and fold description lines into the amount line after them."""
+        pending = ""
+        header = True
+        description = deque(maxlen=_DESCRIPTION_LINES)
+        
+        def compact(line):
+            nonlocal header
+            line = _WHITESPACE_RE.sub(" ", line).strip()
+            if not line:
+                return None
+            # The first line is kept either way: it is usually the column header
+            if header:
+                header = False
+                return line + "\n"
+            if not _DIGIT_RE.search(line):
+                description.append(line)
+                return None
+            if description:
+                line = " ".join((*description, line))
+                description.clear()
+            return line + "\n"
+        
+        for chunk in chunks:
+            lines = (pending + chunk).split("\n")
+            # The last piece may be a line that continues in the next chunk
+            pending = lines.pop()
+            kept = [line for line in map(compact, lines) if line]
+            if kept:
+                yield "".join(kept)
+        
+        line = compact(pending)
+        if line:
+            yield line
+        if description:
+            yield " ".join(description) + "\n"
+    
+    def _collect_window(self, chunks, max_chars: int):
+        """Consume text chunks, keeping only the head and tail that fit in max_chars."""
+        digest = hashlib.sha256()
+        # Budgets are in characters, so a single oversized chunk is sliced to fit
+        head_budget = (max_chars - len(_WINDOW_SEPARATOR)) // 2
+        tail_budget = max_chars - len(_WINDOW_SEPARATOR) - head_budget
+        head = []
+        head_chars = 0
+        tail = deque()
+        tail_chars = 0
+        total_chars = 0
+        
+        for chunk in chunks:
+            digest.update(chunk.encode('utf-8'))
+            total_chars += len(chunk)
+            if head_chars < head_budget:
+                taken = chunk[:head_budget - head_chars]
+                head.append(taken)
+                head_chars += len(taken)
+                chunk = chunk[len(taken):]
+                if not chunk:
+                    continue
+            # Past the head budget: keep a rolling window of the latest characters
+            if len(chunk) >= tail_budget:
+                tail.clear()
+                tail_chars = 0
+                chunk = chunk[len(chunk) - tail_budget:]
+            tail.append(chunk)
+            tail_chars += len(chunk)
+            while tail_chars > tail_budget:
+                excess = tail_chars - tail_budget
+                if len(tail[0]) <= excess:
+                    tail_chars -= len(tail.popleft())
+                else:
+                    tail[0] = tail[0][excess:]
+                    tail_chars -= excess
+        
+        text = "".join(head)
+        if tail:
+            skipped = total_chars - head_chars - tail_chars
+            text = text + (_WINDOW_SEPARATOR if skipped else "") + "".join(tail)
+        return text, digest.hexdigest(), total_chars
+    
+    def _extract_text_from_pdf(self, source: Union[str, BinaryIO]):
+        """Yield the text of a PDF using PyMuPDF, page by page (or range by range)."""
         try:
-            doc = fitz.open(file_path)
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            doc.close()
-            return text
+            if not isinstance(source, str):
+                source = source.read()
+                doc = fitz.open(stream=source, filetype="pdf")
+            else:
+                doc = fitz.open(source)
+            with doc:
+                page_count = doc.page_count
+                workers = min(page_count // _PARALLEL_MIN_PAGES, PROCESS_POOL_WORKERS)
+                if workers <= 1:
+                    yield from self._iter_pdf_pages(doc)
+                    return
+            
+            yield from self._extract_pages_in_parallel(source, page_count, workers)
         except Exception as e:
             logger.error(f"Error extracting text from PDF: {str(e)}")
             raise Exception(f"Failed to extract text from PDF: {str(e)}")
     
-    def _extract_text_from_csv(self, file_path: str) -> str:
-        """Extract text from CSV file."""
+    def _extract_pages_in_parallel(self, source: Union[str, bytes], page_count: int, workers: int):
+        """Extract contiguous page ranges in worker processes, yielding them in page order."""
+        step = -(-page_count // workers)
+        starts = range(0, page_count, step)
+        logger.info(f"Extracting {page_count} PDF pages in {len(starts)} processes")
+        yield from get_process_pool().map(
+            _extract_page_range,
+            [source] * len(starts),
+            starts,
+            [min(start + step, page_count) for start in starts]
+        )
+    
+    def _iter_pdf_pages(self, doc):
+        """Yield the text of each page so only one page is loaded at a time."""
+        for page in doc:
+            yield page.get_text("text")
+    
+    def _extract_text_from_csv(self, source: Union[str, BinaryIO]):
+        """Yield a CSV file as blocks of formatted rows."""
         try:
-            text = ""
-            with open(file_path, 'r', encoding='utf-8') as csvfile:
-                # Try to detect delimiter
-                sample = csvfile.read(1024)
+            # Large reads keep syscalls down on multi-megabyte statements
+            with open_text(source, newline='', buffering=1 << 20) as csvfile:
+                # Try to detect delimiter from the first few rows
+                sample = csvfile.read(4096)
                 csvfile.seek(0)
-                sniffer = csv.Sniffer()
-                delimiter = sniffer.sniff(sample).delimiter
+                delimiter = self._detect_delimiter(sample)
                 
+                # Rows are formatted in blocks so the per-chunk work downstream
+                # (hashing, compaction, windowing) runs once per block, not per row
                 reader = csv.reader(csvfile, delimiter=delimiter)
+                block = []
+                block_chars = 0
                 for row in reader:
-                    text += ", ".join(row) + "\n"
-            return text
+                    line = ", ".join(row) + "\n"
+                    block.append(line)
+                    block_chars += len(line)
+                    if block_chars >= _CSV_CHUNK_CHARS:
+                        yield "".join(block)
+                        block = []
+                        block_chars = 0
+                if block:
+                    yield "".join(block)
         except Exception as e:
             logger.error(f"Error extracting text from CSV: {str(e)}")
             raise Exception(f"Failed to extract text from CSV: {str(e)}")
     
-    def _extract_text_from_txt(self, file_path: str) -> str:
-        """Extract text from TXT file."""
+    def _detect_delimiter(self, sample: str) -> str:
+        """Pick the CSV delimiter, only running the Sniffer when the header row is ambiguous."""
+        header = sample.split("\n", 1)[0]
+        found = [delimiter for delimiter in _CSV_DELIMITERS if delimiter in header]
+        if len(found) == 1:
+            return found[0]
+        return csv.Sniffer().sniff(sample).delimiter
+    
+    def _extract_text_from_txt(self, source: Union[str, BinaryIO]):
+        """Yield a TXT file in 64 KB blocks."""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
+            with open_text(source) as file:
+                yield from iter(lambda: file.read(65536), "")
         except Exception as e:
             logger.error(f"Error extracting text from TXT: {str(e)}")
             raise Exception(f"Failed to extract text from TXT: {str(e)}")
     
     def _analyze_with_claude(self, text: str, financial_goal: str, goal_amount: str, goal_timeframe: str) -> Dict[str, Any]:
         """Analyze financial data with Claude AI."""
-        max_retries = 3
-        retry_delay = 2
+        # Build and serialize once, outside any retries
+        payload = orjson.dumps(self._build_analysis_request(text, financial_goal, goal_amount, goal_timeframe))
+        
+        try:
+            response = self._post_analysis(payload)
+            
+            if response.status_code == 529:
+                raise Exception("API is currently overloaded. Please try again in a few minutes.")
+            
+            if response.status_code != 200:
+                raise Exception(f"API Error: {response.status_code} - {response.text}")
+            
+            # Parse the response
+            resp_json = orjson.loads(response.content)
+            content = resp_json.get("content", [])
+            analysis_text = "".join(item.get("text", "") for item in content if item.get("type") == "text")
+            
+            return self._parse_claude_response(analysis_text)
+            
+        except Exception as e:
+            logger.error(f"Error analyzing with Claude: {str(e)}")
+            raise Exception(f"Failed to analyze financial data: {str(e)}")
+    
+    async def _aanalyze_with_claude(self, text: str, financial_goal: str, goal_amount: str, goal_timeframe: str, client, semaphore) -> Dict[str, Any]:
+        """Async version of _analyze_with_claude sharing one client across a batch."""
+        payload = orjson.dumps(self._build_analysis_request(text, financial_goal, goal_amount, goal_timeframe))
+        
+        try:
+            response = await self._apost_analysis(client, payload, semaphore)
+            
+            if response.status_code == 529:
+                raise Exception("API is currently overloaded. Please try again in a few minutes.")
+            
+            if response.status_code != 200:
+                raise Exception(f"API Error: {response.status_code} - {response.text}")
+            
+            resp_json = orjson.loads(response.content)
+            content = resp_json.get("content", [])
+            analysis_text = "".join(item.get("text", "") for item in content if item.get("type") == "text")
+            
+            return self._parse_claude_response(analysis_text)
+            
+        except Exception as e:
+            logger.error(f"Error analyzing with Claude: {str(e)}")
+            raise Exception(f"Failed to analyze financial data: {str(e)}")
+    
+    def analyze_many(self, jobs: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """Analyze several statements, overlapping the Claude calls.
         
-        for attempt in range(max_retries):
+        Each job is a dict with 'file_path', 'financial_goal' and optionally
+        'goal_amount' and 'goal_timeframe'; results come back in the same order.
+        """
+        results = []
+        pending = {}
+        # The same statement is often analyzed against several goals; open and
+        # extract each file once per call
+        extracted = {}
+        for index, job in enumerate(jobs):
+            goal = (job['financial_goal'], job.get('goal_amount', ''), job.get('goal_timeframe', ''))
             try:
-                # Financial analysis prompt
-                analysis_prompt = f"""
-                As an expert financial advisor, please analyze this bank statement data and provide comprehensive financial advice.
-
-                Bank Statement Data:
-                {text}
-
-                User's Financial Goal: {financial_goal}
-                Goal Amount: {goal_amount}
-                Target Timeframe: {goal_timeframe}
-
-                Please provide your response in the following JSON format:
-                {{
-                    "financial_overview": {{
-                        "total_income": 0.00,
-                        "total_expenses": 0.00,
-                        "net_savings": 0.00,
-                        "analysis_period": "Last X months",
-                        "average_monthly_income": 0.00,
-                        "average_monthly_expenses": 0.00
-                    }},
-                    "spending_breakdown": [
-                        {{
-                            "category": "Housing/Rent",
-                            "amount": 0.00,
-                            "percentage": 0.0,
-                            "frequency": "monthly",
-                            "status": "normal/high/low"
-                        }}
-                    ],
-                    "income_sources": [
-                        {{
-                            "source": "Salary",
-                            "amount": 0.00,
-                            "frequency": "monthly",
-                            "stability": "stable/variable"
-                        }}
-                    ],
-                    "financial_habits": {{
-                        "good_habits": [
-                            "List of positive financial behaviors observed"
-                        ],
-                        "bad_habits": [
-                            "List of concerning spending patterns"
-                        ],
-                        "subscriptions": [
-                            {{
-                                "service": "Service name",
-                                "cost": 0.00,
-                                "frequency": "monthly",
-                                "necessity": "essential/useful/unnecessary"
-                            }}
-                        ]
-                    }},
-                    "goal_analysis": {{
-                        "goal": "{financial_goal}",
-                        "target_amount": "{goal_amount}",
-                        "timeframe": "{goal_timeframe}",
-                        "feasibility": "achievable/challenging/unrealistic",
-                        "current_savings_rate": 0.0,
-                        "required_savings_rate": 0.0,
-                        "monthly_savings_needed": 0.00,
-                        "time_to_reach_goal": "X months/years"
-                    }},
-                    "recommendations": {{
-                        "stop_doing": [
-                            {{
-                                "action": "Specific thing to stop",
-                                "potential_savings": 0.00,
-                                "impact": "high/medium/low"
-                            }}
-                        ],
-                        "start_doing": [
-                            {{
-                                "action": "Specific thing to start",
-                                "potential_benefit": 0.00,
-                                "difficulty": "easy/medium/hard"
-                            }}
-                        ],
-                        "budget_suggestions": [
-                            {{
-                                "category": "Category name",
-                                "current_spending": 0.00,
-                                "recommended_spending": 0.00,
-                                "reason": "Why this change is recommended"
-                            }}
-                        ]
-                    }},
-                    "action_plan": {{
-                        "immediate_actions": [
-                            "Actions to take in the next 30 days"
-                        ],
-                        "short_term_goals": [
-                            "Goals for next 3-6 months"
-                        ],
-                        "long_term_strategy": [
-                            "Long-term financial strategy"
-                        ]
-                    }},
-                    "income_optimization": [
-                        {{
-                            "suggestion": "How to increase income",
-                            "potential_increase": 0.00,
-                            "effort_required": "low/medium/high",
-                            "timeframe": "immediate/short-term/long-term"
-                        }}
-                    ],
-                    "risk_assessment": {{
-                        "emergency_fund_status": "adequate/insufficient/none",
-                        "financial_stability": "stable/at-risk/unstable",
-                        "debt_situation": "none/manageable/concerning/critical",
-                        "recommendations": "Overall risk mitigation advice"
-                    }},
-                    "personalized_insights": "Detailed, personalized advice based on the user's specific situation and goals"
-                }}
-
-                Analyze spending patterns, identify trends, calculate percentages, and provide actionable advice. Be specific with numbers and realistic with recommendations. Consider the user's goal and provide a clear path to achieve it.
-                """
-
-                # Headers for API call
-                headers = {
-                    "Content-Type": "application/json",
-                    "x-api-key": self.api_key,
-                    "anthropic-version": "2023-06-01"
-                }
-                
-                # Analysis call
-                analysis_data = {
-                    "model": self.model,
-                    "max_tokens": 4000,
-                    "messages": [{
-                        "role": "user",
-                        "content": analysis_prompt
-                    }]
-                }
-                
-                response = requests.post(
-                    "https://api.anthropic.com/v1/messages",
-                    headers=headers,
-                    json=analysis_data
-                )
-                
-                # Handle overloaded error with retry
-                if response.status_code == 529:
-                    if attempt < max_retries - 1:
-                        logger.warning(f"API overloaded (attempt {attempt + 1}/{max_retries}). Retrying in {retry_delay} seconds...")
-                        import time
-                        time.sleep(retry_delay)
-                        retry_delay *= 2
-                        continue
-                    else:
-                        raise Exception("API is currently overloaded. Please try again in a few minutes.")
-                
-                if response.status_code != 200:
-                    raise Exception(f"API Error: {response.status_code} - {response.text}")
-                
-                # Parse the response
-                resp_json = response.json()
-                content = resp_json.get("content", [])
-                analysis_text = ""
-                for item in content:
-                    if item.get("type") == "text":
-                        analysis_text += item.get("text", "")
-                
-                return self._parse_claude_response(analysis_text)
-                
+                file_path = job['file_path']
+                if file_path not in extracted:
+                    extracted[file_path] = self._extract_text(file_path, file_path)
+                text, digest, _ = extracted[file_path]
             except Exception as e:
-                if "overloaded" in str(e).lower() and attempt < max_retries - 1:
-                    logger.warning(f"Retrying due to overload error (attempt {attempt + 1}/{max_retries})...")
-                    import time
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
-                    continue
-                else:
-                    logger.error(f"Error analyzing with Claude: {str(e)}")
-                    raise Exception(f"Failed to analyze financial data: {str(e)}")
+                logger.error(f"Error processing financial data: {str(e)}")
+                results.append({'success': False, 'error': str(e)})
+                continue
+            if not text.strip():
+                results.append({'success': False, 'error': 'No data could be extracted from the file'})
+                continue
+            
+            cache_key = (digest, *goal)
+            analysis = _cached_analysis(cache_key)
+            if analysis is not None:
+                results.append({'success': True, 'data': analysis})
+                continue
+            
+            results.append(None)
+            pending[index] = (text, goal, cache_key)
+        
+        async def analyze(text, goal, cache_key, client, semaphore):
+            try:
+                analysis = await self._aanalyze_with_claude(text, *goal, client, semaphore)
+            except Exception as e:
+                logger.error(f"Error processing financial data: {str(e)}")
+                return {'success': False, 'error': str(e)}
+            if 'raw_response' not in analysis:
+                _cache_analysis(cache_key, analysis)
+            return {'success': True, 'data': analysis}
+        
+        async def run():
+            semaphore = asyncio.Semaphore(Config.CLAUDE_MAX_CONCURRENCY)
+            async with create_async_client(_SESSION.headers) as client:
+                return await asyncio.gather(*[
+                    analyze(*job, client, semaphore) for job in pending.values()
+                ])
+        
+        if pending:
+            for index, result in zip(pending, asyncio.run(run())):
+                results[index] = result
+        return results
+    
+    @retry_with_backoff(base_delay=2.0)
+    def _post_analysis(self, payload: bytes):
+        """POST a serialized analysis request, backing off while rate limited or overloaded."""
+        return _SESSION.post(
+            "https://api.anthropic.com/v1/messages",
+            headers={**PROMPT_CACHING_HEADERS, "x-api-key": self.api_key},
+            data=payload,
+            timeout=(5, 120)
+        )
+    
+    @retry_with_backoff(base_delay=2.0)
+    async def _apost_analysis(self, client, payload: bytes, semaphore):
+        """Async version of _post_analysis for the httpx client."""
+        # The slot is taken per attempt, so backoff sleeps don't hold it
+        async with semaphore:
+            return await client.post(
+                "https://api.anthropic.com/v1/messages",
+                headers={**PROMPT_CACHING_HEADERS, "x-api-key": self.api_key},
+                content=payload
+            )
+    
+    def _build_analysis_request(self, text: str, financial_goal: str, goal_amount: str, goal_timeframe: str) -> Dict[str, Any]:
+        """Build the Messages API payload for a financial analysis."""
+        # The breakpoint goes on the statement: the schema alone is under the
+        # 2048-token minimum Haiku caches, and analyzing one statement against
+        # several goals then reuses everything but the goal block
+        return {
+            "model": self.model,
+            "max_tokens": 4000,
+            "system": [{
+                "type": "text",
+                "text": SCHEMA_INSTRUCTIONS
+            }],
+            "messages": [{
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": f"Bank Statement Data:\n{text}",
+                        "cache_control": {"type": "ephemeral"}
+                    },
+                    {
+                        "type": "text",
+                        "text": (
+                            f"User's Financial Goal: {financial_goal}\n"
+                            f"Goal Amount: {goal_amount}\n"
+                            f"Target Timeframe: {goal_timeframe}"
+                        )
+                    }
+                ]
+            }]
+        }
     
     def _parse_claude_response(self, response_text: str) -> Dict[str, Any]:
         """Parse Claude's response and extract JSON data."""
         try:
-            # Try to extract JSON from the response
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-                data = json.loads(json_str)
+            # Try to extract JSON from the response: a linear brace scan first,
+            # then the loose first-to-last-brace match for unbalanced replies
+            json_str = extract_json(response_text)
+            if json_str is None:
+                json_match = _JSON_RE.search(response_text)
+                json_str = json_match.group() if json_match else None
+            if json_str:
+                data = orjson.loads(json_str)
                 
                 # Validate and clean the data
                 return self._validate_and_clean_data(data)
@@ -300,7 +587,7 @@ class FinancialProcessor:
                 # If no JSON found, create a basic structure
                 return self._create_fallback_response(response_text)
                 
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"Error parsing JSON response: {str(e)}")
             return self._create_fallback_response(response_text)
     
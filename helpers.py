@@ -1,8 +1,47 @@
 import os
+import io
+import re
 import json
+import time
+import queue
+import atexit
+import random
+import asyncio
+import logging
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import tiktoken
+from cachetools import LRUCache
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from config import Config
 
+logger = logging.getLogger(__name__)
+
+# Rate limited (429) and overloaded (529) responses are worth retrying
+RETRYABLE_STATUS_CODES = frozenset({429, 529})
+
+# Conversation stats keyed by (user_id, (message count, newest time_ns))
+_STATS_CACHE = LRUCache(maxsize=1024)
+_STATS_CACHE_LOCK = threading.Lock()
+
+# Control characters stripped by sanitize_input (all but newline)
+_CONTROL_CHARS = dict.fromkeys(i for i in range(32) if i != ord('\n'))
+
+# Conversation log entries waiting to be written by the background writer
+_LOG_QUEUE = queue.Queue()
+_LOG_FLUSH_INTERVAL = 1.0
+_LOG_BATCH_SIZE = 100
+_LOG_WRITER_LOCK = threading.Lock()
+_log_writer_thread = None
+# Handle of the current day's log file, owned by the writer thread
+_log_file = {'date': None, 'file': None}
+
 def log_conversation(user_id, user_message, assistant_message):
     """
     Log conversation for analysis or debugging.
@@ -15,9 +54,6 @@ def log_conversation(user_id, user_message, assistant_message):
     if not Config.LOG_CONVERSATIONS:
         return
     
-    # Create logs directory if it doesn't exist
-    os.makedirs('logs', exist_ok=True)
-    
     timestamp = datetime.now().isoformat()
     log_entry = {
         'timestamp': timestamp,
@@ -26,12 +62,85 @@ def log_conversation(user_id, user_message, assistant_message):
         'assistant_message': assistant_message
     }
     
-    # Log to a daily log file
-    log_date = datetime.now().strftime('%Y-%m-%d')
-    log_file = f'logs/chat_{log_date}.log'
+    # Written in batches by a background thread
+    _start_log_writer()
+    _LOG_QUEUE.put(log_entry)
+
+def _start_log_writer():
+    """Start the log writer thread on first use."""
+    global _log_writer_thread
+    with _LOG_WRITER_LOCK:
+        if _log_writer_thread is None:
+            _log_writer_thread = threading.Thread(target=_log_writer, name="conversation-log-writer", daemon=True)
+            _log_writer_thread.start()
+            atexit.register(_stop_log_writer)
+
+def _log_writer():
+    """Drain the log queue, writing up to a second or 100 entries at a time."""
+    try:
+        _drain_log_queue()
+    finally:
+        _close_log_file()
+
+def _drain_log_queue():
+    """Write queued entries in batches until the stop sentinel arrives."""
+    while True:
+        entry = _LOG_QUEUE.get()
+        if entry is None:
+            return
+        batch = [entry]
+        deadline = time.monotonic() + _LOG_FLUSH_INTERVAL
+        while len(batch) < _LOG_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = _LOG_QUEUE.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                _write_log_batch(batch)
+                return
+            batch.append(entry)
+        _write_log_batch(batch)
+
+def _write_log_batch(batch):
+    """Append a batch of entries to their daily log files."""
+    # Log to a daily log file, named after the day each entry was made
+    by_date = {}
+    for entry in batch:
+        by_date.setdefault(entry['timestamp'][:10], []).append(json.dumps(entry) + '\n')
     
-    with open(log_file, 'a', encoding='utf-8') as f:
-        f.write(json.dumps(log_entry) + '\n')
+    for log_date, lines in by_date.items():
+        try:
+            f = _daily_log_file(log_date)
+            f.writelines(lines)
+            f.flush()
+        except OSError as e:
+            logger.error(f"Failed to write conversation log: {str(e)}")
+
+def _daily_log_file(log_date):
+    """Return the open handle for a day's log, rotating when the date changes."""
+    # Only the writer thread touches the handle, so no lock is needed
+    if _log_file['date'] != log_date or _log_file['file'] is None:
+        _close_log_file()
+        # Create logs directory if it doesn't exist
+        os.makedirs('logs', exist_ok=True)
+        _log_file['file'] = open(f'logs/chat_{log_date}.log', 'a', encoding='utf-8', buffering=64 * 1024)
+        _log_file['date'] = log_date
+    return _log_file['file']
+
+def _close_log_file():
+    """Close the current daily log handle, if one is open."""
+    if _log_file['file'] is not None:
+        _log_file['file'].close()
+        _log_file['file'] = None
+        _log_file['date'] = None
+
+def _stop_log_writer():
+    """Flush queued entries before the interpreter exits."""
+    _LOG_QUEUE.put(None)
+    _log_writer_thread.join(timeout=5)
 
 def sanitize_input(text):
     """
@@ -44,7 +153,7 @@ def sanitize_input(text):
         str: Sanitized text
     """
     # Basic sanitation - remove control characters
-    result = ''.join(char for char in text if ord(char) >= 32 or char == '\n')
+    result = text.translate(_CONTROL_CHARS)
     
     # Trim excessive whitespace
     result = ' '.join(result.split())
@@ -62,6 +171,17 @@ def get_conversation_stats(user_id, conversation_manager):
     Returns:
         dict: Statistics about the conversation
     """
+    # Messages are only ever appended, so the count and the newest time_ns
+    # identify this state of the conversation; the revision is read without
+    # copying the history, which is only loaded on a miss
+    revision = conversation_manager.get_revision(user_id)
+    key = (user_id, revision)
+    if revision is not None:
+        with _STATS_CACHE_LOCK:
+            stats = _STATS_CACHE.get(key)
+        if stats is not None:
+            return dict(stats)
+    
     conversation = conversation_manager.get_conversation(user_id)
     if not conversation:
         return {
@@ -71,22 +191,328 @@ def get_conversation_stats(user_id, conversation_manager):
             'first_message_time': None,
             'last_message_time': None
         }
+    timestamps = conversation_manager.get_timestamps(user_id) or []
     
-    # Count different message types
-    user_messages = sum(1 for msg in conversation if msg['role'] == 'user')
-    assistant_messages = sum(1 for msg in conversation if msg['role'] == 'assistant')
+    # Count different message types in a single pass
+    user_messages = 0
+    assistant_messages = 0
+    for msg in conversation:
+        role = msg['role']
+        if role == 'user':
+            user_messages += 1
+        elif role == 'assistant':
+            assistant_messages += 1
     
-    # Get timestamps
-    timestamps = [datetime.fromisoformat(msg['timestamp']) for msg in conversation 
-                 if 'timestamp' in msg]
-    
-    first_time = min(timestamps) if timestamps else None
-    last_time = max(timestamps) if timestamps else None
-    
-    return {
+    # ISO 8601 strings in one format sort chronologically
+    stats = {
         'message_count': len(conversation),
         'user_messages': user_messages,
         'assistant_messages': assistant_messages,
-        'first_message_time': first_time.isoformat() if first_time else None,
-        'last_message_time': last_time.isoformat() if last_time else None
-    }
\ No newline at end of file
+        'first_message_time': min(timestamps) if timestamps else None,
+        'last_message_time': max(timestamps) if timestamps else None
+    }
+    if revision is not None:
+        with _STATS_CACHE_LOCK:
+            _STATS_CACHE[key] = stats
+    return dict(stats)
+
+# Sent per request by the callers that mark blocks with cache_control
+PROMPT_CACHING_HEADERS = {"anthropic-beta": "prompt-caching-2024-07-31"}
+
+@functools.lru_cache(maxsize=None)
+def anthropic_session():
+    """
+    Return the requests session shared by the document and video analyzers.
+    
+    Transport-level retries only cover failed connects, so a billed POST that
+    reached the API is never resent here; 429/529 responses are left to
+    retry_with_backoff, which honors Retry-After.
+    
+    Returns:
+        requests.Session: Pooled keep-alive session with the Anthropic headers
+    """
+    session = requests.Session()
+    session.headers.update({
+        "Content-Type": "application/json",
+        "anthropic-version": "2023-06-01"
+    })
+    session.mount("https://", HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=64,
+        max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2)
+    ))
+    return session
+
+def create_async_client(headers=None):
+    """
+    Create an HTTP/2 client for a batch of concurrent Claude calls.
+    
+    The client is tied to the event loop it is used on, so create one per
+    asyncio.run() and close it with "async with".
+    
+    Args:
+        headers (dict, optional): Default headers for every request
+        
+    Returns:
+        httpx.AsyncClient: Pooled async HTTP client
+    """
+    return httpx.AsyncClient(
+        http2=True,
+        headers=dict(headers or {}),
+        limits=httpx.Limits(max_connections=256, max_keepalive_connections=64),
+        timeout=120
+    )
+
+def open_text(source, newline=None, buffering=-1):
+    """
+    Open a file path or a binary file-like object as UTF-8 text.
+    
+    Args:
+        source (str or file-like): Path on disk or binary stream
+        newline (str, optional): Newline handling, as for open()
+        buffering (int, optional): Read buffer size for paths, as for open()
+        
+    Returns:
+        file-like: Text stream; use it as a context manager
+    """
+    if isinstance(source, str):
+        return open(source, 'r', encoding='utf-8', newline=newline, buffering=buffering)
+    return io.TextIOWrapper(source, encoding='utf-8', newline=newline)
+
+def extract_json(text):
+    """
+    Extract the first balanced JSON object from a block of text.
+    
+    Scans the text once, tracking brace depth while skipping over string
+    literals, so braces inside values don't end the object early.
+    
+    Args:
+        text (str): Text that may contain a JSON object
+        
+    Returns:
+        str: The JSON object substring, or None if no balanced object is found
+    """
+    start = text.find('{')
+    if start == -1:
+        return None
+    
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    
+    return None
+
+@functools.lru_cache(maxsize=None)
+def _get_token_encoding():
+    """Load the BPE table once; cl100k_base is a close proxy for Claude's tokenizer."""
+    return tiktoken.get_encoding("cl100k_base")
+
+def truncate_to_token_budget(text, max_tokens):
+    """
+    Keep text within a token budget by dropping the middle.
+    
+    Args:
+        text (str): Text to send to Claude
+        max_tokens (int): Maximum number of (approximate) tokens to keep
+        
+    Returns:
+        str: The original text, or its head and tail joined by an ellipsis
+    """
+    encoding = _get_token_encoding()
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    
+    half = max_tokens // 2
+    return encoding.decode(tokens[:half]) + "\n...\n" + encoding.decode(tokens[-half:])
+
+# Whitespace that follows the end of a sentence
+_SENTENCE_BREAK_RE = re.compile(r'(?<=[.!?])\s+')
+
+def split_by_token_budget(text, max_tokens):
+    """
+    Split text into consecutive pieces that each fit a token budget.
+    
+    Pieces break between sentences; a single sentence longer than the
+    budget (e.g. an unpunctuated transcript) is cut at token boundaries.
+    
+    Args:
+        text (str): Text to split
+        max_tokens (int): Maximum number of (approximate) tokens per piece
+        
+    Returns:
+        list: The pieces in order, or [text] when it already fits
+    """
+    encoding = _get_token_encoding()
+    pieces = []
+    current = []
+    current_tokens = 0
+    
+    for sentence in _SENTENCE_BREAK_RE.split(text):
+        tokens = encoding.encode(sentence, disallowed_special=())
+        if current and current_tokens + len(tokens) > max_tokens:
+            pieces.append(" ".join(current))
+            current = []
+            current_tokens = 0
+        
+        if len(tokens) > max_tokens:
+            for start in range(0, len(tokens), max_tokens):
+                pieces.append(encoding.decode(tokens[start:start + max_tokens]))
+            continue
+        
+        current.append(sentence)
+        current_tokens += len(tokens)
+    
+    if current:
+        pieces.append(" ".join(current))
+    return pieces or [text]
+
+# Worker processes for PyMuPDF, which is not thread-safe. Started once, on first
+# use, with spawn: forking a server that already runs threads (TTS loop, log
+# writer, job executor, CTranslate2) can deadlock on locks the child inherits.
+_PROCESS_POOL = None
+_PROCESS_POOL_LOCK = threading.Lock()
+PROCESS_POOL_WORKERS = min(8, max(1, (os.cpu_count() or 1) // Config.WORKER_PROCESSES))
+
+def get_process_pool():
+    """
+    Return the shared pool of worker processes, starting it on the first call.
+    
+    Spawned workers import only what their tasks need. When the app is run
+    directly with python app.py they re-run it as __mp_main__, which skips
+    init_services(), so they never load the Whisper model or the services.
+    
+    Returns:
+        ProcessPoolExecutor: Pool of PROCESS_POOL_WORKERS long-lived processes
+    """
+    global _PROCESS_POOL
+    with _PROCESS_POOL_LOCK:
+        if _PROCESS_POOL is None:
+            _PROCESS_POOL = ProcessPoolExecutor(
+                max_workers=PROCESS_POOL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _PROCESS_POOL
+
+# Fastest first; int8_float16 needs tensor cores (compute capability 7.0+)
+_CUDA_COMPUTE_TYPES = ("int8_float16", "float16", "int8", "float32")
+_CPU_COMPUTE_TYPES = ("int8", "float32")
+
+@functools.lru_cache(maxsize=None)
+def whisper_device_settings():
+    """
+    Resolve the Whisper device and compute type for this machine.
+    
+    "auto" settings are resolved by asking CTranslate2 which compute types the
+    device supports, so older GPUs (no tensor cores) and CPU-only hosts get the
+    fastest type they can actually run instead of failing to load.
+    
+    Returns:
+        tuple: (device, compute_type) for faster_whisper.WhisperModel
+    """
+    import ctranslate2
+    
+    device = Config.WHISPER_DEVICE
+    if device == "auto":
+        device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+    
+    compute_type = Config.WHISPER_COMPUTE_TYPE
+    if compute_type == "auto":
+        supported = ctranslate2.get_supported_compute_types(device)
+        preferred = _CUDA_COMPUTE_TYPES if device == "cuda" else _CPU_COMPUTE_TYPES
+        compute_type = next((ct for ct in preferred if ct in supported), "default")
+    
+    logger.info(f"Whisper will run on {device} with compute type {compute_type}")
+    return device, compute_type
+
+def backoff_delay(attempt, response=None, base_delay=1.0, max_delay=60.0, jitter=0.5):
+    """
+    Work out how long to wait before retrying a rate-limited request.
+    
+    Args:
+        attempt (int): Zero-based number of the attempt that just failed
+        response (optional): HTTP response whose Retry-After header is honored
+        base_delay (float): Delay before the first retry, doubled each attempt
+        max_delay (float): Upper bound on the exponential delay
+        jitter (float): Maximum random extra delay, to spread out retries
+        
+    Returns:
+        float: Seconds to sleep
+    """
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after) + random.uniform(0, jitter)
+        except ValueError:
+            pass
+    return min(max_delay, base_delay * 2 ** attempt) + random.uniform(0, jitter)
+
+def _status_of(response):
+    """HTTP status of a requests/httpx (status_code) or urllib3 (status) response."""
+    status = getattr(response, "status_code", None)
+    return response.status if status is None else status
+
+def retry_with_backoff(max_retries=3, base_delay=1.0, max_delay=60.0, jitter=0.5):
+    """
+    Retry a function returning an HTTP response while it is rate limited.
+    
+    Works on plain and async functions. The wrapped function should return a
+    requests, urllib3 or httpx response; 429 and 529 responses are retried with
+    exponential backoff and jitter, honoring Retry-After when the API sends it.
+    The last response is returned as-is once retries are exhausted.
+    
+    Args:
+        max_retries (int): Number of retries after the first attempt
+        base_delay (float): Delay before the first retry, doubled each attempt
+        max_delay (float): Upper bound on the exponential delay
+        jitter (float): Maximum random extra delay, to spread out retries
+        
+    Returns:
+        callable: Decorator
+    """
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                for attempt in range(max_retries + 1):
+                    response = await func(*args, **kwargs)
+                    status = _status_of(response)
+                    if status not in RETRYABLE_STATUS_CODES or attempt == max_retries:
+                        return response
+                    delay = backoff_delay(attempt, response, base_delay, max_delay, jitter)
+                    logger.warning(f"API returned {status} (attempt {attempt + 1}/{max_retries + 1}). Retrying in {delay:.1f} seconds...")
+                    await response.aclose()
+                    await asyncio.sleep(delay)
+            return async_wrapper
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(max_retries + 1):
+                response = func(*args, **kwargs)
+                status = _status_of(response)
+                if status not in RETRYABLE_STATUS_CODES or attempt == max_retries:
+                    return response
+                delay = backoff_delay(attempt, response, base_delay, max_delay, jitter)
+                logger.warning(f"API returned {status} (attempt {attempt + 1}/{max_retries + 1}). Retrying in {delay:.1f} seconds...")
+                response.close()
+                time.sleep(delay)
+        return wrapper
+    
+    return decorator
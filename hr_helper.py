@@ -1,10 +1,66 @@
 import os
+import re
+import asyncio
+import threading
+import orjson
 from werkzeug.utils import secure_filename
-import PyPDF2
+import fitz  # PyMuPDF
 import docx
-import requests
 from io import BytesIO
+from cachetools import TTLCache
 from config import Config
+from helpers import PROCESS_POOL_WORKERS, PROMPT_CACHING_HEADERS, anthropic_session, create_async_client, get_process_pool, retry_with_backoff
+from message_batches import MessageBatchClient
+
+# Shared with the other analyzers so Anthropic calls reuse pooled connections
+_SESSION = anthropic_session()
+
+# MuPDF is not thread-safe, so larger uploads are extracted in the shared
+# worker processes, one CV per task
+_PARALLEL_MIN_CVS = 4
+
+CV_SEPARATOR = "\n---------------------------------\n"
+
+# CVs per request when screening through the Batches API; each request
+# shortlists its chunk and a final call ranks the shortlisted CVs together
+CVS_PER_BATCH_REQUEST = 10
+
+# Finished batch screenings, so repeated result polls don't re-run the final ranking
+_BATCH_RESULTS = TTLCache(maxsize=256, ttl=3600)
+_BATCH_RESULTS_LOCK = threading.Lock()
+
+# Static screening instructions, sent as the system block ahead of the cached
+# CVs, so it must stay byte-identical
+SCREENING_INSTRUCTIONS = """Please analyze the CVs provided and select the requested number of best candidates for the position named after them based on:
+- Work experience relevance
+- Education background
+- Skills match
+- Overall qualifications
+
+For each selected candidate, please provide the following information in this exact format:
+
+Candidate X:
+Full Name: [Extract full name]
+Email: [Extract email or N/A if not provided]
+Phone Number: [Extract phone number or N/A if not provided]
+Years of Experience: [Calculate or estimate years of experience]
+Education: [Highest education level and field]
+LinkedIn: [Extract LinkedIn profile or N/A if not provided]
+Website: [Extract personal website or N/A if not provided]
+
+Please only return the requested number of candidates in the format above, ranking them from best to least suitable."""
+
+# Instructions for the per-chunk batch requests: picks are named by their CV
+# label so the final ranking call can be sent the original CVs
+SHORTLIST_INSTRUCTIONS = """Please analyze the CVs provided and select the requested number of best candidates for the position named after them based on:
+- Work experience relevance
+- Education background
+- Skills match
+- Overall qualifications
+
+Each CV starts with a line of the form "CV: <filename>". For each selected candidate, copy that line exactly as it appears, one per line, ranking them from best to least suitable.
+
+Please only return those lines, with no other text."""
 
 class HRHelper:
     """Service for processing CVs and finding the best candidates."""
@@ -12,21 +68,21 @@ class HRHelper:
     def __init__(self, api_key=None):
         self.api_key = api_key or Config.CLAUDE_API_KEY
         self.model = "claude-3-5-haiku-20241022"
-        self.allowed_extensions = {'pdf', 'doc', 'docx'}
+        self.allowed_extensions = frozenset({'pdf', 'doc', 'docx'})
     
     def allowed_file(self, filename):
         """Check if file extension is allowed."""
-        return '.' in filename and \
-               filename.rsplit('.', 1)[1].lower() in self.allowed_extensions
+        return self._file_extension(filename) in self.allowed_extensions
+    
+    def _file_extension(self, filename):
+        """Lower-case extension of a filename, without the dot."""
+        return os.path.splitext(filename)[1][1:].lower()
     
     def extract_text_from_pdf(self, file_stream):
         """Extract text from PDF file."""
         try:
-            pdf_reader = PyPDF2.PdfReader(file_stream)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+            with fitz.open(stream=file_stream.read(), filetype="pdf") as doc:
+                return "".join(f"{page.get_text('text')}\n" for page in doc)
         except Exception as e:
             return f"Error reading PDF: {str(e)}"
     
@@ -34,10 +90,7 @@ class HRHelper:
         """Extract text from DOCX file."""
         try:
             doc = docx.Document(file_stream)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
+            return "".join(f"{paragraph.text}\n" for paragraph in doc.paragraphs)
         except Exception as e:
             return f"Error reading DOCX: {str(e)}"
     
@@ -52,103 +105,273 @@ class HRHelper:
     
     def process_cv_files(self, files):
         """Process uploaded CV files and extract text."""
-        all_cv_texts = []
+        # Join all CV texts with separator
+        return CV_SEPARATOR.join(self.extract_cv_texts(files))
+    
+    def extract_cv_texts(self, files):
+        """Extract the text of each uploaded CV, labelled with its filename."""
+        uploads = []
         
         for file in files:
-            if file and self.allowed_file(file.filename):
+            if not file:
+                continue
+            file_extension = self._file_extension(file.filename)
+            if file_extension in self.allowed_extensions:
                 filename = secure_filename(file.filename)
-                file_extension = filename.rsplit('.', 1)[1].lower()
                 
                 # Read file content
-                file_content = file.read()
-                file_stream = BytesIO(file_content)
-                
-                # Extract text based on file type
-                if file_extension == 'pdf':
-                    text = self.extract_text_from_pdf(file_stream)
-                elif file_extension == 'docx':
-                    text = self.extract_text_from_docx(file_stream)
-                elif file_extension == 'doc':
-                    # For DOC files, we'll return a message
-                    text = self.extract_text_from_doc(None)
-                else:
-                    text = "Unsupported file format"
-                
-                all_cv_texts.append(f"CV: {filename}\n{text}")
+                uploads.append((filename, file_extension, file.read()))
         
-        # Join all CV texts with separator
-        combined_text = "\n---------------------------------\n".join(all_cv_texts)
-        return combined_text
+        if len(uploads) < _PARALLEL_MIN_CVS or PROCESS_POOL_WORKERS <= 1:
+            return [self._extract_cv_text(upload) for upload in uploads]
+        
+        # map() keeps the CVs in upload order
+        return list(get_process_pool().map(self._extract_cv_text, uploads))
+    
+    def _extract_cv_text(self, upload):
+        """Extract one uploaded CV from its (filename, extension, bytes) tuple."""
+        filename, file_extension, file_content = upload
+        file_stream = BytesIO(file_content)
+        
+        # Extract text based on file type
+        if file_extension == 'pdf':
+            text = self.extract_text_from_pdf(file_stream)
+        elif file_extension == 'docx':
+            text = self.extract_text_from_docx(file_stream)
+        elif file_extension == 'doc':
+            # For DOC files, we'll return a message
+            text = self.extract_text_from_doc(None)
+        else:
+            text = "Unsupported file format"
+        
+        return f"CV: {filename}\n{text}"
+    
+    def _build_analysis_request(self, job_role, cv_texts, top_count, instructions=SCREENING_INSTRUCTIONS):
+        """Build the Messages API payload for ranking CVs against a job role."""
+        # Static instructions, then the CVs, then the role: the breakpoint is on
+        # the CVs so ranking them for several roles reuses the prefix. The
+        # instructions alone are under the 2048-token minimum Haiku caches.
+        return {
+            "model": self.model,
+            "max_tokens": 4000,
+            "system": [{
+                "type": "text",
+                "text": instructions
+            }],
+            "messages": [{
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": f"Below are {len(cv_texts.split('---------------------------------'))} CVs separated by dashes:\n\n{cv_texts}",
+                        "cache_control": {"type": "ephemeral"}
+                    },
+                    {
+                        "type": "text",
+                        "text": f"I am looking for candidates for the position: {job_role}\n\nPlease select the TOP {top_count} best candidates for the {job_role} position."
+                    }
+                ]
+            }]
+        }
+    
+    def _shortlisted_cvs(self, reply, cv_texts):
+        """Return the CVs whose "CV: <filename>" label is named in a shortlist reply, in upload order."""
+        shortlisted = []
+        for cv_text in cv_texts:
+            label = cv_text.split("\n", 1)[0][len("CV: "):]
+            if label and re.search(rf"CV:\s*{re.escape(label)}(?![\w.-])", reply):
+                shortlisted.append(cv_text)
+        return shortlisted
+    
+    def _extract_response_text(self, resp_json):
+        """Concatenate the text blocks of a Messages API response."""
+        content = resp_json.get("content", [])
+        return "".join(item.get("text", "") for item in content if item.get("type") == "text")
     
     def analyze_cvs_with_claude(self, job_role, cv_texts, top_count):
         """Send CV texts to Claude API for analysis."""
         try:
-            prompt = f"""
-            I am looking for candidates for the position: {job_role}
-
-            Below are {len(cv_texts.split('---------------------------------'))} CVs separated by dashes:
-
-            {cv_texts}
-
-            Please analyze these CVs and select the TOP {top_count} best candidates for the {job_role} position based on:
-            - Work experience relevance
-            - Education background
-            - Skills match
-            - Overall qualifications
-
-            For each selected candidate, please provide the following information in this exact format:
-
-            Candidate X:
-            Full Name: [Extract full name]
-            Email: [Extract email or N/A if not provided]
-            Phone Number: [Extract phone number or N/A if not provided]
-            Years of Experience: [Calculate or estimate years of experience]
-            Education: [Highest education level and field]
-            LinkedIn: [Extract LinkedIn profile or N/A if not provided]
-            Website: [Extract personal website or N/A if not provided]
-
-            Please only return the top {top_count} candidates in the format above, ranking them from best to least suitable.
-            """
-
-            # Headers for API call
-            headers = {
-                "Content-Type": "application/json",
-                "x-api-key": self.api_key,
-                "anthropic-version": "2023-06-01"
-            }
+            # Serialized once, not again on each retry
+            payload = orjson.dumps(self._build_analysis_request(job_role, cv_texts, top_count))
+            response = self._post_analysis(payload)
             
-            # Data payload
-            data = {
-                "model": self.model,
-                "max_tokens": 4000,
-                "messages": [{
-                    "role": "user",
-                    "content": prompt
-                }]
-            }
+            if response.status_code != 200:
+                return f"API Error: {response.status_code} - {response.text}"
             
-            # Make the API call
-            response = requests.post(
-                "https://api.anthropic.com/v1/messages",
-                headers=headers,
-                json=data
-            )
+            # Parse the response
+            return self._extract_response_text(orjson.loads(response.content))
+        
+        except Exception as e:
+            return f"Error analyzing CVs: {str(e)}"
+    
+    async def aanalyze_cvs_with_claude(self, job_role, cv_texts, top_count, client, semaphore):
+        """Async version of analyze_cvs_with_claude sharing one client across roles."""
+        try:
+            payload = orjson.dumps(self._build_analysis_request(job_role, cv_texts, top_count))
+            response = await self._apost_analysis(client, payload, semaphore)
             
             if response.status_code != 200:
                 return f"API Error: {response.status_code} - {response.text}"
             
-            # Parse the response
-            resp_json = response.json()
+            return self._extract_response_text(orjson.loads(response.content))
+        
+        except Exception as e:
+            return f"Error analyzing CVs: {str(e)}"
+    
+    @retry_with_backoff(base_delay=2.0)
+    def _post_analysis(self, payload: bytes):
+        """POST a serialized analysis request, backing off while rate limited or overloaded."""
+        return _SESSION.post(
+            "https://api.anthropic.com/v1/messages",
+            headers={**PROMPT_CACHING_HEADERS, "x-api-key": self.api_key},
+            data=payload,
+            timeout=(5, 120)
+        )
+    
+    @retry_with_backoff(base_delay=2.0)
+    async def _apost_analysis(self, client, payload: bytes, semaphore):
+        """Async version of _post_analysis for the httpx client."""
+        # The slot is taken per attempt, so backoff sleeps don't hold it
+        async with semaphore:
+            return await client.post(
+                "https://api.anthropic.com/v1/messages",
+                headers={**PROMPT_CACHING_HEADERS, "x-api-key": self.api_key},
+                content=payload
+            )
+    
+    def analyze_cvs_for_roles(self, job_roles, files, top_count):
+        """Rank the same CVs for several job roles, with the Claude calls running concurrently."""
+        try:
+            if not job_roles or not all(job_roles):
+                return {'error': 'Job role is required'}
             
-            # Extract content from the response
-            content = resp_json.get("content", [])
-            response_text = ""
+            if not files or all(file.filename == '' for file in files):
+                return {'error': 'Please upload at least one CV file'}
             
-            for item in content:
-                if item.get("type") == "text":
-                    response_text += item.get("text", "")
+            # CVs are extracted once and shared by every role
+            cv_texts = self.process_cv_files(files)
             
-            return response_text
+            if not cv_texts:
+                return {'error': 'No valid CV files found'}
+            
+            async def run():
+                semaphore = asyncio.Semaphore(Config.CLAUDE_MAX_CONCURRENCY)
+                async with create_async_client(_SESSION.headers) as client:
+                    return await asyncio.gather(*[
+                        self.aanalyze_cvs_with_claude(job_role, cv_texts, top_count, client, semaphore)
+                        for job_role in job_roles
+                    ])
+            
+            analyses = asyncio.run(run())
+            
+            return {
+                'success': True,
+                'top_count': top_count,
+                'files_processed': len([f for f in files if f.filename != '']),
+                'analyses': dict(zip(job_roles, analyses))
+            }
+        
+        except Exception as e:
+            return {'error': f'An error occurred: {str(e)}'}
+    
+    def submit_cvs_batch(self, job_role, cv_texts_list, top_count, files_processed):
+        """Queue a large set of CVs on the Message Batches API (half price) and return the batch id."""
+        chunks = [
+            cv_texts_list[start:start + CVS_PER_BATCH_REQUEST]
+            for start in range(0, len(cv_texts_list), CVS_PER_BATCH_REQUEST)
+        ]
+        # A single chunk is ranked in the batch itself; otherwise each
+        # request only names its picks
+        instructions = SCREENING_INSTRUCTIONS if len(chunks) == 1 else SHORTLIST_INSTRUCTIONS
+        batch_requests = []
+        sources = {}
+        for index, chunk in enumerate(chunks):
+            custom_id = f"cvs-{index}"
+            batch_requests.append({
+                "custom_id": custom_id,
+                "params": self._build_analysis_request(job_role, CV_SEPARATOR.join(chunk), top_count, instructions)
+            })
+            # Any worker may serve the result poll, so each request records
+            # its CVs and the screening settings alongside the batch
+            sources[custom_id] = orjson.dumps({
+                "job_role": job_role,
+                "top_count": top_count,
+                "files_processed": files_processed,
+                "cvs": chunk
+            }).decode('utf-8')
+        
+        return MessageBatchClient(self.api_key).submit("cv", batch_requests, sources)
+    
+    def poll_cvs_batch(self, batch_id):
+        """
+        Return the screening result of a CV batch, or None while it is still processing.
+        
+        Raises KeyError if no CV batch with this id was submitted.
+        """
+        with _BATCH_RESULTS_LOCK:
+            result = _BATCH_RESULTS.get(batch_id)
+        if result is not None:
+            return result
+        
+        client = MessageBatchClient(self.api_key)
+        sources = client.sources(batch_id, kind="cv")
+        if not sources:
+            raise KeyError(batch_id)
+        
+        try:
+            batch = client.status(batch_id)
+            if batch.get("processing_status") != "ended":
+                return None
+            
+            chunk_requests = [orjson.loads(sources[f"cvs-{index}"]) for index in range(len(sources))]
+            job = chunk_requests[0]
+            analysis = self._rank_batch_results(
+                client, batch, job["job_role"], [request["cvs"] for request in chunk_requests], job["top_count"]
+            )
+        except Exception as e:
+            return {'error': f'An error occurred: {str(e)}'}
+        
+        result = {
+            'success': True,
+            'job_role': job["job_role"],
+            'top_count': job["top_count"],
+            'files_processed': job["files_processed"],
+            'analysis': analysis
+        }
+        with _BATCH_RESULTS_LOCK:
+            _BATCH_RESULTS[batch_id] = result
+        return result
+    
+    def _rank_batch_results(self, client, batch, job_role, chunks, top_count):
+        """Rank the CVs of an ended batch from its per-chunk replies."""
+        try:
+            # Results can arrive in any order; a failed chunk fails the whole
+            # screening rather than leaving its CVs out of the ranking
+            replies = {}
+            for row in client.results(batch):
+                try:
+                    replies[row.get("custom_id")] = client.message_text(row)
+                except Exception as e:
+                    replies[row.get("custom_id")] = e
+            
+            shortlisted = []
+            for index, chunk in enumerate(chunks):
+                reply = replies.get(f"cvs-{index}")
+                first, last = index * CVS_PER_BATCH_REQUEST + 1, index * CVS_PER_BATCH_REQUEST + len(chunk)
+                if reply is None:
+                    return f"Error analyzing CVs: batch {batch['id']} returned no result for CVs {first}-{last}"
+                if isinstance(reply, Exception):
+                    return f"Error analyzing CVs {first}-{last}: {str(reply)}"
+                if len(chunks) == 1:
+                    return reply
+                
+                picks = self._shortlisted_cvs(reply, chunk)
+                if not picks:
+                    return f"Error analyzing CVs {first}-{last}: the shortlist named none of their CVs"
+                shortlisted.extend(picks)
+            
+            # A single interactive call ranks the shortlisted CVs overall
+            return self.analyze_cvs_with_claude(job_role, CV_SEPARATOR.join(shortlisted), top_count)
         
         except Exception as e:
             return f"Error analyzing CVs: {str(e)}"
@@ -163,19 +386,30 @@ class HRHelper:
                 return {'error': 'Please upload at least one CV file'}
             
             # Process CV files
-            cv_texts = self.process_cv_files(files)
+            cv_texts_list = self.extract_cv_texts(files)
             
-            if not cv_texts:
+            if not cv_texts_list:
                 return {'error': 'No valid CV files found'}
             
+            files_processed = len([f for f in files if f.filename != ''])
+            
+            # Bulk runs go through the cheaper Batches API, which can take
+            # hours; the caller polls poll_cvs_batch with the batch id
+            if len(cv_texts_list) >= Config.HR_BATCH_MIN_FILES:
+                return {
+                    'success': True,
+                    'status': 'pending',
+                    'batch_id': self.submit_cvs_batch(job_role, cv_texts_list, top_count, files_processed)
+                }
+            
             # Analyze with Claude
-            analysis_result = self.analyze_cvs_with_claude(job_role, cv_texts, top_count)
+            analysis_result = self.analyze_cvs_with_claude(job_role, CV_SEPARATOR.join(cv_texts_list), top_count)
             
             return {
                 'success': True,
                 'job_role': job_role,
                 'top_count': top_count,
-                'files_processed': len([f for f in files if f.filename != '']),
+                'files_processed': files_processed,
                 'analysis': analysis_result
             }
         
@@ -0,0 +1,69 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+from config import Config
+
+# sqlite connections are opened per call, this only serializes writers in-process
+_DB_LOCK = threading.Lock()
+
+def cache_key(*parts: str) -> str:
+    """SHA-256 hex digest of the given strings, used as a cache key."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class LLMCache:
+    """Key/value store for model outputs in sqlite, with a time-to-live."""
+
+    def __init__(self, db_path=None, ttl=None):
+        self.db_path = db_path or Config.LLM_CACHE_PATH
+        self.ttl = Config.LLM_CACHE_TTL if ttl is None else ttl
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection to the cache database."""
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _init_db(self):
+        """Create the cache table on first use; WAL lets readers run during writes."""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with _DB_LOCK, self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            if self.ttl:
+                conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,))
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for a key, or None if missing or expired."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?",
+                (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        value, created_at = row
+        if self.ttl and time.time() - created_at > self.ttl:
+            return None
+        return value
+
+    def set(self, key: str, value: str):
+        """Store a value, replacing any previous entry for the key."""
+        with _DB_LOCK, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?)",
+                (key, value, time.time())
+            )
@@ -0,0 +1,149 @@
+import os
+import orjson
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Any, Iterator
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+BATCHES_URL = "https://api.anthropic.com/v1/messages/batches"
+
+# Shared HTTP session for the batch endpoints; GETs are safe to retry
+_SESSION = requests.Session()
+_SESSION.headers.update({
+    "Content-Type": "application/json",
+    "anthropic-version": "2023-06-01",
+    "anthropic-beta": "message-batches-2024-09-24"
+})
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=2,
+    pool_maxsize=4,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504, 529],
+        allowed_methods=frozenset({"GET"}),
+        raise_on_status=False
+    )
+))
+
+# sqlite connections are opened per call, this only serializes writers in-process
+_DB_LOCK = threading.Lock()
+
+class MessageBatchClient:
+    """Submits Claude requests through the Message Batches API and tracks them in sqlite."""
+
+    def __init__(self, api_key=None, db_path=None):
+        self.api_key = api_key or Config.CLAUDE_API_KEY
+        self.db_path = db_path or Config.BATCH_DB_PATH
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection to the batch job database."""
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _init_db(self):
+        """Create the job table on first use."""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with _DB_LOCK, self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS batch_requests (
+                    batch_id TEXT NOT NULL,
+                    custom_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (batch_id, custom_id)
+                )
+            """)
+
+    def submit(self, kind: str, batch_requests: List[Dict[str, Any]], sources: Dict[str, str]) -> str:
+        """Submit a batch of {"custom_id", "params"} requests and record where each came from."""
+        response = _SESSION.post(
+            BATCHES_URL,
+            headers={"x-api-key": self.api_key},
+            data=orjson.dumps({"requests": batch_requests}),
+            timeout=(5, 120)
+        )
+        if response.status_code != 200:
+            raise Exception(f"API Error: {response.status_code} - {response.text}")
+
+        batch_id = orjson.loads(response.content)["id"]
+        created_at = time.time()
+        with _DB_LOCK, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO batch_requests VALUES (?, ?, ?, ?, ?)",
+                [(batch_id, custom_id, kind, source, created_at) for custom_id, source in sources.items()]
+            )
+
+        logger.info(f"Submitted {kind} batch {batch_id} with {len(batch_requests)} requests")
+        return batch_id
+
+    def sources(self, batch_id: str, kind: str = None) -> Dict[str, str]:
+        """Return the custom_id -> source mapping recorded for a batch, optionally only of one kind."""
+        with self._connect() as conn:
+            if kind is None:
+                rows = conn.execute(
+                    "SELECT custom_id, source FROM batch_requests WHERE batch_id = ?",
+                    (batch_id,)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT custom_id, source FROM batch_requests WHERE batch_id = ? AND kind = ?",
+                    (batch_id, kind)
+                ).fetchall()
+        return dict(rows)
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        """Fetch the current state of a batch."""
+        response = _SESSION.get(
+            f"{BATCHES_URL}/{batch_id}",
+            headers={"x-api-key": self.api_key},
+            timeout=(5, 30)
+        )
+        if response.status_code != 200:
+            raise Exception(f"API Error: {response.status_code} - {response.text}")
+        return orjson.loads(response.content)
+
+    def wait(self, batch_id: str, poll_interval: float = 60, timeout: float = None) -> Dict[str, Any]:
+        """Poll a batch until processing has ended, or until timeout seconds have passed."""
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            batch = self.status(batch_id)
+            if batch.get("processing_status") == "ended":
+                return batch
+            if deadline and time.monotonic() + poll_interval > deadline:
+                return batch
+            time.sleep(poll_interval)
+
+    def results(self, batch: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Stream the JSONL results of an ended batch one row at a time."""
+        with _SESSION.get(
+            batch["results_url"],
+            headers={"x-api-key": self.api_key},
+            stream=True,
+            timeout=(5, 300)
+        ) as response:
+            if response.status_code != 200:
+                raise Exception(f"API Error: {response.status_code} - {response.text}")
+            for line in response.iter_lines(decode_unicode=True):
+                if line:
+                    yield orjson.loads(line)
+
+    @staticmethod
+    def message_text(row: Dict[str, Any]) -> str:
+        """Return the text of a succeeded result row, or raise with the failure reason."""
+        result = row.get("result", {})
+        if result.get("type") != "succeeded":
+            error = result.get("error", {})
+            raise Exception(f"Batch request {result.get('type', 'failed')}: {error.get('message', error)}")
+        content = result.get("message", {}).get("content", [])
+        return "".join(item.get("text", "") for item in content if item.get("type") == "text")
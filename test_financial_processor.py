@@ -0,0 +1,52 @@
+import unittest
+from financial_processor import FinancialProcessor, _WINDOW_SEPARATOR
+
+
+class CollectWindowTest(unittest.TestCase):
+    """The statement window must stay within the prompt budget."""
+
+    def setUp(self):
+        self.processor = FinancialProcessor(api_key="test")
+
+    def test_text_within_budget_is_kept_whole(self):
+        text, _, total_chars = self.processor._collect_window(iter(["a\n", "b\n"]), 100)
+        self.assertEqual(text, "a\nb\n")
+        self.assertEqual(total_chars, 4)
+
+    def test_chunk_larger_than_budget_is_sliced(self):
+        chunk = "".join(f"{i:05d}\n" for i in range(20000))
+        text, _, total_chars = self.processor._collect_window(iter([chunk]), 1000)
+        self.assertLessEqual(len(text), 1000)
+        self.assertIn(_WINDOW_SEPARATOR, text)
+        self.assertTrue(text.startswith(chunk[:100]))
+        self.assertTrue(text.endswith(chunk[-100:]))
+        self.assertEqual(total_chars, len(chunk))
+
+    def test_many_large_chunks_stay_within_budget(self):
+        chunks = [f"{i}" * 65536 for i in range(10)]
+        text, _, _ = self.processor._collect_window(iter(chunks), 60000)
+        self.assertLessEqual(len(text), 60000)
+        self.assertIn(_WINDOW_SEPARATOR, text)
+        self.assertTrue(text.endswith(chunks[-1][-100:]))
+
+
+
+class CompactLinesTest(unittest.TestCase):
+    """Compaction must keep the description of a transaction split over several lines."""
+
+    def setUp(self):
+        self.processor = FinancialProcessor(api_key="test")
+
+    def test_description_line_is_joined_onto_amount_line(self):
+        chunks = ["Date Description Amount\n\nTESCO STO", "RES LONDON\n01/02/2024  -23.10\n"]
+        text = "".join(self.processor._compact_lines(iter(chunks)))
+        self.assertEqual(text, "Date Description Amount\nTESCO STORES LONDON 01/02/2024 -23.10\n")
+
+    def test_only_the_last_description_lines_are_kept(self):
+        chunks = ["Date Amount\nTerms apply\nSee overleaf\nNETFLIX.COM\nMonthly plan\n02/02/2024 -9.99"]
+        text = "".join(self.processor._compact_lines(iter(chunks)))
+        self.assertEqual(text, "Date Amount\nNETFLIX.COM Monthly plan 02/02/2024 -9.99\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
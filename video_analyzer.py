@@ -1,175 +1,476 @@
 import yt_dlp
-import whisper
+from faster_whisper import WhisperModel
+import asyncio
+import contextlib
 import tempfile
+import threading
+import shutil
 import os
 import json
-import re
-import requests
+import hashlib
+import orjson
 from config import Config
+from helpers import anthropic_session, create_async_client, retry_with_backoff, split_by_token_budget, whisper_device_settings
+from llm_cache import LLMCache, cache_key
+
+# Shared with the other analyzers so Anthropic calls reuse pooled connections
+_SESSION = anthropic_session()
+
+# Speech only needs 16 kHz mono: take the best audio-only stream up to 64 kbps,
+# else the smallest audio-only stream, and only then a full video
+AUDIO_FORMAT = 'bestaudio[abr<=64]/worstaudio/best'
+
+# Static fact-checking instructions and JSON format, sent ahead of the
+# transcription: 182 tokens with the helpers' cl100k_base encoding, down from
+# 586 for VERBOSE_ANALYSIS_INSTRUCTIONS. Not marked for prompt caching: with the
+# tool definition it is a few hundred tokens, well under the 2048-token minimum
+# Haiku caches.
+ANALYSIS_INSTRUCTIONS = """Fact-check this video transcription.
+
+1. List EVERY significant claim: facts, statistics, historical or scientific statements, advice, opinions presented as facts, debatable points and conclusions.
+2. Score each claim's reliability 0-100 (90+ accurate and verifiable, 70-89 minor issues, 50-69 missing context, 30-49 misleading, <30 false or dangerous).
+3. Explain each score in 3-4 sentences: why, missing context, impact of believing or sharing it.
+4. Summarize the video's topic and message, assess its credibility (presenter expertise, biases, red flags), and recommend what viewers should do.
+
+Respond as JSON:
+{"claims_analysis": [{"information": "...", "reliability_score": 0, "description": "..."}], "summary": "...", "general_assessment": "...", "analysis_description": "..."}"""
+
+# Original long-form instructions, kept for quality comparisons (VIDEO_VERBOSE_PROMPT)
+VERBOSE_ANALYSIS_INSTRUCTIONS = """As an expert fact-checker and information analyst, please thoroughly analyze this video content for accuracy, reliability, and overall quality.
+
+IMPORTANT: Identify and analyze ALL significant claims, facts, statistics, statements, and pieces of information presented in this video. Do not limit yourself to just a few - extract and evaluate EVERY important piece of information, including:
+- Factual claims and statements
+- Statistics and numbers mentioned
+- Historical references
+- Scientific claims
+- Personal opinions presented as facts
+- Recommendations or advice given
+- Any controversial or debatable points
+- Background information provided
+- Conclusions drawn by the presenter
+
+For each significant claim, fact, or piece of information presented, provide:
+1. The specific information or claim
+2. A reliability/accuracy score from 0-100 where:
+   - 90-100: Completely accurate, well-sourced, verifiable
+   - 70-89: Mostly accurate with minor issues or context needed
+   - 50-69: Partially accurate but missing important context or nuance
+   - 30-49: Misleading or significantly inaccurate
+   - 0-29: False, fabricated, or dangerous misinformation
+3. A comprehensive explanation (3-4 sentences minimum) covering:
+   - Why you assigned this specific score
+   - What makes this information reliable or unreliable
+   - Any missing context or nuance
+   - Potential consequences of believing/sharing this information
+
+Be thorough and comprehensive - if a video contains 20 different claims or pieces of information, analyze all 20. If it contains 50, analyze all 50. Do not skip any important information.
+
+Also provide your expert opinion on:
+- What this video is really about and its main message
+- The overall credibility and trustworthiness of the content
+- Whether the presenter demonstrates expertise in the subject
+- Any red flags, biases, or concerning patterns you notice
+- Your personal assessment of whether viewers should trust this content
+- Recommendations for viewers (should they share it, be cautious, seek additional sources, etc.)
+
+Please format your response as JSON with this structure:
+{
+    "claims_analysis": [
+        {
+            "information": "The specific claim or information presented",
+            "reliability_score": 85,
+            "description": "Comprehensive 3-4 sentence analysis explaining the score, reliability factors, missing context, and potential impact of this information"
+        }
+    ],
+    "summary": "Detailed summary of what this video is about, its main arguments, and overall message",
+    "general_assessment": "Your expert opinion on the video's credibility, the presenter's expertise, any biases or red flags, and overall trustworthiness",
+    "analysis_description": "Your professional recommendation for viewers - should they trust this content, share it, be cautious, or seek additional sources? Include your reasoning and any warnings."
+}"""
+
+# Forcing this tool makes Claude return the analysis as a parsed JSON object
+ANALYSIS_TOOL = {
+    "name": "emit_analysis",
+    "description": "Record the fact-check analysis of the video.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "claims_analysis": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "information": {"type": "string"},
+                        "reliability_score": {"type": "integer", "minimum": 0, "maximum": 100},
+                        "description": {"type": "string"}
+                    },
+                    "required": ["information", "reliability_score", "description"]
+                }
+            },
+            "summary": {"type": "string"},
+            "general_assessment": {"type": "string"},
+            "analysis_description": {"type": "string"}
+        },
+        "required": ["claims_analysis", "summary", "general_assessment", "analysis_description"]
+    }
+}
+
+# Smaller model tried once when the configured one is still overloaded (529) after
+# backing off; it caps output at 4096 tokens
+FALLBACK_MODEL = "claude-3-haiku-20240307"
+FALLBACK_MAX_TOKENS = 4096
+
+# Short clips have few claims, so a smaller output budget is enough; long ones
+# get the model's full 8192 so their analysis isn't cut off
+SHORT_TRANSCRIPT_CHARS = 2000
+
+# Longer transcriptions are analyzed in parts of about this many tokens, concurrently
+TRANSCRIPT_CHUNK_TOKENS = 3000
+
+# Reduce step for a transcription analyzed in parts
+OVERVIEW_INSTRUCTIONS = """These are fact-check notes on consecutive parts of one video. Combine them into a single overview of the whole video: its topic and message (summary), its credibility, presenter expertise, biases and red flags (general_assessment), and what viewers should do (analysis_description)."""
+
+OVERVIEW_TOOL = {
+    "name": "emit_overview",
+    "description": "Record the overview of the whole video.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "summary": {"type": "string"},
+            "general_assessment": {"type": "string"},
+            "analysis_description": {"type": "string"}
+        },
+        "required": ["summary", "general_assessment", "analysis_description"]
+    }
+}
+
+_JSON_DECODER = json.JSONDecoder()
+
+# Keys an analysis must have to be returned and cached, per tool
+_REQUIRED_KEYS = {
+    tool["name"]: tool["input_schema"]["required"] for tool in (ANALYSIS_TOOL, OVERVIEW_TOOL)
+}
 
 class VideoAnalyzer:
-    def __init__(self, api_key=None):
-        self.whisper_model = None
+    def __init__(self, api_key=None, whisper_model=None, preload=None, model=None, transcribe_lock=None):
+        # An already loaded WhisperModel can be passed in to share it, together
+        # with the lock its other users hold while transcribing
+        self.whisper_model = whisper_model
+        self._model_lock = threading.Lock()
+        self._transcribe_lock = transcribe_lock or threading.Lock()
         self.api_key = api_key or Config.CLAUDE_API_KEY
+        self.model = model or Config.VIDEO_ANALYSIS_MODEL
+        self.cache = LLMCache()
+        # Download directories still holding audio that transcribe_audio has to remove
+        self._temp_dirs = set()
+        
+        # Load the model in the background at startup so the first video doesn't wait for it
+        if preload is None:
+            preload = Config.WHISPER_PRELOAD
+        if preload and self.whisper_model is None:
+            threading.Thread(target=self.load_whisper_model, daemon=True).start()
         
     def load_whisper_model(self):
         """Load Whisper model for transcription"""
-        if self.whisper_model is None:
-            print("Loading Whisper model...")
-            self.whisper_model = whisper.load_model("base")
-        return self.whisper_model
+        # May be called from the background loader and transcribe_audio at once
+        with self._model_lock:
+            if self.whisper_model is None:
+                print("Loading Whisper model...")
+                # CTranslate2 backend, with the fastest compute type the device supports
+                device, compute_type = whisper_device_settings()
+                self.whisper_model = WhisperModel(
+                    Config.WHISPER_MODEL_SIZE,
+                    device=device,
+                    compute_type=compute_type,
+                    cpu_threads=max(1, (os.cpu_count() or 1) // Config.WORKER_PROCESSES)
+                )
+            return self.whisper_model
+    
+    def probe_video(self, url: str) -> dict:
+        """Fetch a video's metadata without downloading it"""
+        try:
+            with yt_dlp.YoutubeDL({'format': AUDIO_FORMAT}) as ydl:
+                return ydl.extract_info(url, download=False)
+        except Exception as e:
+            print(f"Error fetching video info: {str(e)}")
+            return None
+    
+    def _video_cache_key(self, info: dict) -> str:
+        """Transcription cache key for a video's canonical id, or None"""
+        if not info or not info.get('id'):
+            return None
+        return cache_key("transcript-video", info.get('extractor_key', ''), info['id'])
+    
+    def cached_transcription(self, info: dict) -> str:
+        """Return the stored transcription of a video seen before, or None"""
+        key = self._video_cache_key(info)
+        return self.cache.get(key) if key else None
     
-    def download_video_audio(self, url: str) -> str:
+    def download_video_audio(self, url: str, info: dict = None) -> str:
         """Download video and extract audio"""
         temp_dir = tempfile.mkdtemp()
+        self._temp_dirs.add(temp_dir)
         
+        # The audio is kept in its original container: faster-whisper decodes
+        # and resamples it to 16 kHz mono itself, so no WAV conversion pass
         ydl_opts = {
-            'format': 'bestaudio/best',
+            'format': AUDIO_FORMAT,
             'outtmpl': os.path.join(temp_dir, 'video.%(ext)s'),
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'wav',
-                'preferredquality': '192',
-            }],
         }
         
         try:
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
+                # Reuse already probed metadata instead of extracting it again
+                if info:
+                    info = ydl.process_ie_result(info, download=True)
+                else:
+                    info = ydl.extract_info(url, download=True)
+                audio_path = ydl.prepare_filename(info)
+            
+            if os.path.exists(audio_path):
+                return audio_path
             
-            # Find the audio file
-            for file in os.listdir(temp_dir):
-                if file.endswith('.wav'):
-                    audio_path = os.path.join(temp_dir, file)
-                    return audio_path
-                    
         except Exception as e:
             print(f"Error downloading video: {str(e)}")
-            return None
+        
+        # Nothing to transcribe, so drop the directory and any partial download now
+        self._remove_temp_dir(temp_dir)
+        return None
+    
+    def _remove_temp_dir(self, temp_dir: str):
+        """Delete a download directory and forget it"""
+        self._temp_dirs.discard(temp_dir)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    def _audio_cache_key(self, audio_path: str) -> str:
+        """Transcription cache key for the audio file's contents"""
+        digest = hashlib.blake2b(digest_size=16)
+        with open(audio_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return cache_key("transcript-audio", digest.hexdigest())
     
-    def transcribe_audio(self, audio_path: str) -> str:
+    def transcribe_audio(self, audio_path: str, info: dict = None) -> str:
         """Transcribe audio using Whisper"""
         try:
-            model = self.load_whisper_model()
-            print("Transcribing video...")
-            result = model.transcribe(audio_path)
-            return result["text"]
+            # Identical audio (e.g. the same video under another URL) skips Whisper
+            audio_key = self._audio_cache_key(audio_path)
+            transcription = self.cache.get(audio_key)
+            
+            if transcription is None:
+                model = self.load_whisper_model()
+                print("Transcribing video...")
+                # Greedy decoding; VAD skips silence and music without speech.
+                # CTranslate2 already uses every core it was given, so calls are
+                # serialized; segments are lazy, so consume them under the lock
+                with self._transcribe_lock:
+                    segments, _ = model.transcribe(audio_path, beam_size=1, vad_filter=True)
+                    transcription = "".join(segment.text for segment in segments).strip()
+            
+            if transcription:
+                self.cache.set(audio_key, transcription)
+                video_key = self._video_cache_key(info)
+                if video_key:
+                    self.cache.set(video_key, transcription)
+            return transcription
         except Exception as e:
             print(f"Error transcribing audio: {str(e)}")
             return None
         finally:
-            # Clean up audio file
-            if os.path.exists(audio_path):
+            # Clean up audio file, with the directory download_video_audio created for it
+            temp_dir = os.path.dirname(audio_path)
+            if temp_dir in self._temp_dirs:
+                self._remove_temp_dir(temp_dir)
+            elif os.path.exists(audio_path):
                 os.remove(audio_path)
     
+    def _build_analysis_request(self, transcription: str, label: str = "Video content to analyze") -> dict:
+        """Build the Messages API payload for a transcription"""
+        # Data payload
+        return {
+            "model": self.model,
+            "max_tokens": 1500 if len(transcription) < SHORT_TRANSCRIPT_CHARS else 8192,
+            "temperature": 0,
+            "tools": [ANALYSIS_TOOL],
+            "tool_choice": {"type": "tool", "name": ANALYSIS_TOOL["name"]},
+            "messages": [{
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": VERBOSE_ANALYSIS_INSTRUCTIONS if Config.VIDEO_VERBOSE_PROMPT else ANALYSIS_INSTRUCTIONS
+                    },
+                    {
+                        "type": "text",
+                        "text": f"{label}:\n{transcription}"
+                    }
+                ]
+            }]
+        }
+    
+    def _parse_analysis_response(self, response, tool_name: str = ANALYSIS_TOOL["name"]) -> dict:
+        """Turn a requests or httpx Messages API response into the analysis dict"""
+        if response.status_code != 200:
+            print(f"API Error: {response.status_code} - {response.text}")
+            return None
+        
+        # Parse the response
+        resp_json = orjson.loads(response.content)
+        
+        # A reply cut off at max_tokens holds a partial analysis
+        if resp_json.get("stop_reason") == "max_tokens":
+            print("Claude's analysis was cut off at max_tokens")
+            return None
+        
+        # The forced tool call carries the analysis as an already decoded object
+        content = resp_json.get("content", [])
+        analysis = next(
+            (item.get("input") for item in content
+             if item.get("type") == "tool_use" and item.get("name") == tool_name),
+            None
+        )
+        
+        if analysis is None:
+            # Fallback: decode the first JSON object in the text reply
+            response_text = "".join(item.get("text", "") for item in content if item.get("type") == "text")
+            start = response_text.find("{")
+            if start == -1:
+                # If no JSON found, try to parse the entire response
+                analysis = orjson.loads(response_text)
+            else:
+                analysis = _JSON_DECODER.raw_decode(response_text, start)[0]
+        
+        return self._validated_analysis(analysis, tool_name)
+    
+    def _validated_analysis(self, analysis, tool_name: str) -> dict:
+        """Return the analysis if it has every key its tool requires, else None"""
+        if not isinstance(analysis, dict):
+            print("Claude's analysis is not an object")
+            return None
+        missing = [key for key in _REQUIRED_KEYS[tool_name] if key not in analysis]
+        if missing:
+            print(f"Claude's analysis is missing {', '.join(missing)}")
+            return None
+        if "claims_analysis" in analysis and not isinstance(analysis["claims_analysis"], list):
+            print("Claude's claims_analysis is not a list")
+            return None
+        return analysis
+    
     def analyze_with_claude(self, transcription: str) -> dict:
         """Analyze transcription with Claude API"""
-        prompt = f"""
-        As an expert fact-checker and information analyst, please thoroughly analyze this video content for accuracy, reliability, and overall quality.
-
-        IMPORTANT: Identify and analyze ALL significant claims, facts, statistics, statements, and pieces of information presented in this video. Do not limit yourself to just a few - extract and evaluate EVERY important piece of information, including:
-        - Factual claims and statements
-        - Statistics and numbers mentioned
-        - Historical references
-        - Scientific claims
-        - Personal opinions presented as facts
-        - Recommendations or advice given
-        - Any controversial or debatable points
-        - Background information provided
-        - Conclusions drawn by the presenter
-
-        For each significant claim, fact, or piece of information presented, provide:
-        1. The specific information or claim
-        2. A reliability/accuracy score from 0-100 where:
-           - 90-100: Completely accurate, well-sourced, verifiable
-           - 70-89: Mostly accurate with minor issues or context needed
-           - 50-69: Partially accurate but missing important context or nuance
-           - 30-49: Misleading or significantly inaccurate
-           - 0-29: False, fabricated, or dangerous misinformation
-        3. A comprehensive explanation (3-4 sentences minimum) covering:
-           - Why you assigned this specific score
-           - What makes this information reliable or unreliable
-           - Any missing context or nuance
-           - Potential consequences of believing/sharing this information
-
-        Be thorough and comprehensive - if a video contains 20 different claims or pieces of information, analyze all 20. If it contains 50, analyze all 50. Do not skip any important information.
-
-        Also provide your expert opinion on:
-        - What this video is really about and its main message
-        - The overall credibility and trustworthiness of the content
-        - Whether the presenter demonstrates expertise in the subject
-        - Any red flags, biases, or concerning patterns you notice
-        - Your personal assessment of whether viewers should trust this content
-        - Recommendations for viewers (should they share it, be cautious, seek additional sources, etc.)
-
-        Please format your response as JSON with this structure:
-        {{
-            "claims_analysis": [
-                {{
-                    "information": "The specific claim or information presented",
-                    "reliability_score": 85,
-                    "description": "Comprehensive 3-4 sentence analysis explaining the score, reliability factors, missing context, and potential impact of this information"
-                }}
-            ],
-            "summary": "Detailed summary of what this video is about, its main arguments, and overall message",
-            "general_assessment": "Your expert opinion on the video's credibility, the presenter's expertise, any biases or red flags, and overall trustworthiness",
-            "analysis_description": "Your professional recommendation for viewers - should they trust this content, share it, be cautious, or seek additional sources? Include your reasoning and any warnings."
-        }}
-        
-        Video content to analyze:
-        {transcription}
-        """
-        
         try:
             print("Analyzing content with Claude AI...")
             
-            # Headers for API call
-            headers = {
-                "Content-Type": "application/json",
-                "x-api-key": self.api_key,
-                "anthropic-version": "2023-06-01"
-            }
+            data = self._build_analysis_request(transcription)
+            keys = self._analysis_cache_keys(transcription, data)
+            analysis = self._cached_analysis(keys)
+            if analysis is not None:
+                return analysis
             
-            # Data payload
-            data = {
-                "model": "claude-3-5-haiku-20241022",
-                "max_tokens": 4000,
-                "temperature": 0,
-                "messages": [{
-                    "role": "user",
-                    "content": prompt
-                }]
-            }
+            chunks = split_by_token_budget(transcription, TRANSCRIPT_CHUNK_TOKENS)
+            if len(chunks) > 1:
+                analysis = asyncio.run(self._analyze_chunks_with_new_client(chunks))
+            else:
+                # Make the API call
+                response = self._request_analysis(data)
+                analysis = self._parse_analysis_response(response)
             
-            # Make the API call
-            response = requests.post(
+            if analysis:
+                self._cache_analysis(keys, analysis)
+            return analysis
+                
+        except json.JSONDecodeError as e:
+            print(f"Error parsing Claude response: {str(e)}")
+            return None
+        except Exception as e:
+            print(f"Error analyzing with Claude: {str(e)}")
+            return None
+    
+    def _analysis_cache_keys(self, transcription: str, data: dict) -> tuple:
+        """Cache keys for an analysis: the exact request, then the transcription per prompt variant and model"""
+        # The second key still hits after edits to a prompt's wording, but never
+        # returns a concise-prompt analysis when the verbose one is asked for
+        variant = "verbose" if Config.VIDEO_VERBOSE_PROMPT else "concise"
+        return (
+            cache_key("video-analysis-request", orjson.dumps(data, option=orjson.OPT_SORT_KEYS).decode('utf-8')),
+            cache_key("video-analysis", variant, self.model, transcription)
+        )
+    
+    def _cached_analysis(self, keys: tuple) -> dict:
+        """Return a previously stored analysis for any of the keys, or None"""
+        for key in keys:
+            cached = self.cache.get(key)
+            if cached is not None:
+                print("Using cached analysis")
+                return orjson.loads(cached)
+        return None
+    
+    def _cache_analysis(self, keys: tuple, analysis: dict):
+        """Store an analysis under all of its keys"""
+        value = orjson.dumps(analysis).decode('utf-8')
+        for key in keys:
+            self.cache.set(key, value)
+    
+    def _fallback_request(self, data: dict) -> dict:
+        """The same analysis request on FALLBACK_MODEL"""
+        print(f"{data['model']} is overloaded, retrying with {FALLBACK_MODEL}")
+        return {**data, "model": FALLBACK_MODEL, "max_tokens": min(data["max_tokens"], FALLBACK_MAX_TOKENS)}
+    
+    def _request_analysis(self, data: dict):
+        """POST an analysis request, switching to the smaller model if still overloaded"""
+        response = self._post_analysis(data)
+        if response.status_code == 529 and data["model"] != FALLBACK_MODEL:
+            response = self._post_analysis(self._fallback_request(data))
+        return response
+    
+    async def _arequest_analysis(self, client, data: dict, semaphore=None):
+        """Async version of _request_analysis for the httpx client"""
+        response = await self._apost_analysis(client, data, semaphore)
+        if response.status_code == 529 and data["model"] != FALLBACK_MODEL:
+            response = await self._apost_analysis(client, self._fallback_request(data), semaphore)
+        return response
+    
+    @retry_with_backoff(base_delay=2.0)
+    def _post_analysis(self, data: dict):
+        """POST an analysis request, backing off while rate limited or overloaded"""
+        return _SESSION.post(
+            "https://api.anthropic.com/v1/messages",
+            headers={"x-api-key": self.api_key},
+            data=orjson.dumps(data),
+            timeout=(5, 120)
+        )
+    
+    @retry_with_backoff(base_delay=2.0)
+    async def _apost_analysis(self, client, data: dict, semaphore=None):
+        """Async version of _post_analysis for the httpx client"""
+        # The slot is taken per attempt, so backoff sleeps don't hold it
+        async with semaphore or contextlib.nullcontext():
+            return await client.post(
                 "https://api.anthropic.com/v1/messages",
-                headers=headers,
-                json=data
+                headers={"x-api-key": self.api_key},
+                content=orjson.dumps(data)
             )
+    
+    async def aanalyze_with_claude(self, transcription: str, client) -> dict:
+        """Async version of analyze_with_claude on a shared httpx client"""
+        try:
+            print("Analyzing content with Claude AI...")
             
-            if response.status_code != 200:
-                print(f"API Error: {response.status_code} - {response.text}")
-                return None
-            
-            # Parse the response
-            resp_json = response.json()
-            
-            # Extract content from the response
-            content = resp_json.get("content", [])
-            response_text = ""
-            
-            for item in content:
-                if item.get("type") == "text":
-                    response_text += item.get("text", "")
+            data = self._build_analysis_request(transcription)
+            keys = self._analysis_cache_keys(transcription, data)
+            analysis = self._cached_analysis(keys)
+            if analysis is not None:
+                return analysis
             
-            # Extract JSON from response
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
+            chunks = split_by_token_budget(transcription, TRANSCRIPT_CHUNK_TOKENS)
+            if len(chunks) > 1:
+                analysis = await self._aanalyze_chunks(chunks, client)
             else:
-                # If no JSON found, try to parse the entire response
-                return json.loads(response_text)
+                response = await self._arequest_analysis(client, data)
+                analysis = self._parse_analysis_response(response)
+            
+            if analysis:
+                self._cache_analysis(keys, analysis)
+            return analysis
                 
         except json.JSONDecodeError as e:
             print(f"Error parsing Claude response: {str(e)}")
@@ -178,19 +479,77 @@ class VideoAnalyzer:
             print(f"Error analyzing with Claude: {str(e)}")
             return None
     
+    async def _analyze_chunks_with_new_client(self, chunks: list) -> dict:
+        """Run _aanalyze_chunks on its own httpx client, for the synchronous path"""
+        async with create_async_client(_SESSION.headers) as client:
+            return await self._aanalyze_chunks(chunks, client)
+    
+    async def _aanalyze_chunks(self, chunks: list, client) -> dict:
+        """Map-reduce a long transcription: fact-check the parts concurrently, then merge them"""
+        print(f"Analyzing transcription in {len(chunks)} parts...")
+        semaphore = asyncio.Semaphore(Config.CLAUDE_MAX_CONCURRENCY)
+        
+        async def analyze_part(index, chunk):
+            # Same instructions as a single call, only the label differs
+            data = self._build_analysis_request(
+                chunk, f"Part {index} of {len(chunks)} of the video content to analyze"
+            )
+            response = await self._arequest_analysis(client, data, semaphore)
+            return self._parse_analysis_response(response)
+        
+        parts = await asyncio.gather(*[
+            analyze_part(index, chunk) for index, chunk in enumerate(chunks, 1)
+        ])
+        if not all(parts):
+            return None
+        
+        claims = [claim for part in parts for claim in part.get("claims_analysis", [])]
+        notes = "\n\n".join(
+            f"[Part {index} of {len(parts)}]\n"
+            f"Summary: {part.get('summary', '')}\n"
+            f"Assessment: {part.get('general_assessment', '')}\n"
+            f"Recommendation: {part.get('analysis_description', '')}"
+            for index, part in enumerate(parts, 1)
+        )
+        
+        response = await self._arequest_analysis(client, {
+            "model": self.model,
+            "max_tokens": 1500,
+            "temperature": 0,
+            "tools": [OVERVIEW_TOOL],
+            "tool_choice": {"type": "tool", "name": OVERVIEW_TOOL["name"]},
+            "messages": [{
+                "role": "user",
+                "content": f"{OVERVIEW_INSTRUCTIONS}\n\n{notes}"
+            }]
+        })
+        overview = self._parse_analysis_response(response, OVERVIEW_TOOL["name"])
+        if not overview:
+            return None
+        
+        return {"claims_analysis": claims, **overview}
+    
     def analyze_video(self, video_url: str) -> dict:
         """Complete video analysis pipeline"""
         try:
-            # Step 1: Download audio
-            print("Downloading video audio...")
-            audio_path = self.download_video_audio(video_url)
+            # Load the model while the audio downloads
+            threading.Thread(target=self.load_whisper_model, daemon=True).start()
             
-            if not audio_path:
-                return {'error': 'Failed to download video audio'}
+            # Videos transcribed before skip the download and Whisper
+            info = self.probe_video(video_url)
+            transcription = self.cached_transcription(info)
             
-            # Step 2: Transcribe
-            print("Transcribing video...")
-            transcription = self.transcribe_audio(audio_path)
+            if transcription is None:
+                # Step 1: Download audio
+                print("Downloading video audio...")
+                audio_path = self.download_video_audio(video_url, info)
+                
+                if not audio_path:
+                    return {'error': 'Failed to download video audio'}
+                
+                # Step 2: Transcribe
+                print("Transcribing video...")
+                transcription = self.transcribe_audio(audio_path, info)
             
             if not transcription:
                 return {'error': 'Failed to transcribe video'}
@@ -212,3 +571,57 @@ class VideoAnalyzer:
         except Exception as e:
             print(f"Error in video analysis: {str(e)}")
             return {'error': str(e)}
+    
+    async def analyze_video_async(self, video_url: str, client, semaphore, transcribe_semaphore) -> dict:
+        """Video analysis pipeline as a coroutine, so several URLs overlap"""
+        try:
+            # Bounds how many videos are downloaded and held on disk at once
+            async with semaphore:
+                # yt-dlp and the Whisper model are synchronous, so they run in worker threads
+                info = await asyncio.to_thread(self.probe_video, video_url)
+                transcription = await asyncio.to_thread(self.cached_transcription, info)
+                
+                if transcription is None:
+                    print(f"Downloading video audio: {video_url}")
+                    audio_path = await asyncio.to_thread(self.download_video_audio, video_url, info)
+                    
+                    if not audio_path:
+                        return {'error': 'Failed to download video audio'}
+                    
+                    # One transcription at a time: CTranslate2 already uses every core it was given
+                    async with transcribe_semaphore:
+                        transcription = await asyncio.to_thread(self.transcribe_audio, audio_path, info)
+                
+                if not transcription:
+                    return {'error': 'Failed to transcribe video'}
+                
+                analysis = await self.aanalyze_with_claude(transcription, client)
+                
+                if not analysis:
+                    return {'error': 'Failed to analyze content'}
+                
+                return {
+                    'success': True,
+                    'transcription': transcription,
+                    'analysis': analysis
+                }
+            
+        except Exception as e:
+            print(f"Error in video analysis: {str(e)}")
+            return {'error': str(e)}
+    
+    def analyze_videos(self, video_urls: list) -> list:
+        """Analyze several videos, overlapping downloads, transcription and Claude calls"""
+        async def run():
+            semaphore = asyncio.Semaphore(Config.CLAUDE_MAX_CONCURRENCY)
+            transcribe_semaphore = asyncio.Semaphore(1)
+            async with create_async_client(_SESSION.headers) as client:
+                return await asyncio.gather(*[
+                    self.analyze_video_async(video_url, client, semaphore, transcribe_semaphore)
+                    for video_url in video_urls
+                ])
+        
+        # Load the model while the first downloads run
+        threading.Thread(target=self.load_whisper_model, daemon=True).start()
+        
+        return asyncio.run(run())